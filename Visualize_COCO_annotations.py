@@ -1,5 +1,4 @@
 import os
-import json
 import random
 import base64
 import IPython
@@ -7,12 +6,37 @@ import requests
 import numpy as np
 from io import BytesIO
 from math import trunc
+from html import escape
+from collections import OrderedDict
 from PIL import Image
-from PIL import ImageDraw
+
+import coco_stream
+from mask_cache import MaskCache, decode_segmentation
+
+
+def _lru_get(cache, key):
+    value = cache.get(key)
+    if value is not None:
+        cache.move_to_end(key)
+    return value
+
+
+def _lru_put(cache, key, value, max_items):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > max_items:
+        cache.popitem(last=False)
+
 
 # Load the dataset json
 class CocoDataset():
-    def __init__(self, annotation_path, image_dir):
+    # In-memory query engine over one COCO file. Annotations are indexed by
+    # id, image, category and supercategory; numeric fields are kept as
+    # arrays so area/bbox range queries are vectorized. Masks are decoded
+    # lazily into a compressed MaskCache, thumbnails and mask overlays are
+    # encoded once.
+    def __init__(self, annotation_path, image_dir, mask_cache_bytes=64 * 1024 * 1024, thumbnail_cache_size=64,
+                 overlay_cache_size=256):
         self.annotation_path = annotation_path
         self.image_dir = image_dir
         self.colors = ['blue', 'purple', 'red', 'green', 'orange', 'salmon', 'pink', 'gold',
@@ -20,10 +44,16 @@ class CocoDataset():
                         'teal', 'aquamarine', 'steelblue', 'powderblue', 'dodgerblue', 'navy',
                         'magenta', 'sienna', 'maroon']
         
-        json_file = open(self.annotation_path)
-        self.coco = json.load(json_file)
-        json_file.close()
+        self.thumbnail_cache_size = thumbnail_cache_size
+        self.overlay_cache_size = overlay_cache_size
+        self.mask_cache = MaskCache(mask_cache_bytes)
+        self._thumbnails = OrderedDict()
+        self._overlays = OrderedDict()
+
+        self.coco = coco_stream.load_coco(self.annotation_path)
 
+        self.process_info()
+        self.process_licenses()
         self.process_categories()
         self.process_images()
         self.process_segmentations()
@@ -75,22 +105,176 @@ class CocoDataset():
                 print(f'    id {cat_id}: {self.categories[cat_id]["name"]}')
             print('')
 
-    def display_image(self, image_id, show_polys=True, show_bbox=True, show_labels=True, show_crowds=True, use_url=False):
-        pass
+    def display_image(self, image_id=None, show_polys=True, show_bbox=True, show_labels=True, show_crowds=True,
+                      use_url=False, max_size=800):
+        """HTML for one image with its annotations; a random image when image_id is None.
+
+        The image is a memoized base64 thumbnail and the annotations are
+        drawn over it as SVG in original pixel coordinates, so toggling
+        the show_* flags never re-encodes the image. Crowd (RLE) masks are
+        embedded as small transparent PNGs.
+        """
+        if image_id is None:
+            image_id = random.choice(list(self.images))
+        image = self.images[image_id]
+        width, height = image['width'], image['height']
+        thumbnail, thumb_width, thumb_height = self.thumbnail(image_id, use_url, max_size)
+
+        shapes = []
+        for annotation in self.segmentations.get(image_id, []):
+            category = self.categories.get(annotation['category_id'], {})
+            color = self.colors[annotation['category_id'] % len(self.colors)]
+            segmentation = annotation.get('segmentation')
+            if annotation.get('iscrowd', 0):
+                if show_crowds and segmentation:
+                    shapes.append(f'<image href="data:image/png;base64,{self.mask_png_base64(annotation["id"], color)}" '
+                                  f'x="0" y="0" width="{width}" height="{height}" />')
+            elif show_polys and isinstance(segmentation, list):
+                for polygon in segmentation:
+                    points = ' '.join(f'{x},{y}' for x, y in zip(polygon[::2], polygon[1::2]))
+                    shapes.append(f'<polygon points="{points}" fill="{color}" fill-opacity="0.4" '
+                                  f'stroke="{color}" stroke-width="2" />')
+            elif show_polys and segmentation:
+                shapes.append(f'<image href="data:image/png;base64,{self.mask_png_base64(annotation["id"], color)}" '
+                              f'x="0" y="0" width="{width}" height="{height}" />')
+
+            if annotation.get('bbox'):
+                x, y, w, h = annotation['bbox']
+                if show_bbox:
+                    shapes.append(f'<rect x="{x}" y="{y}" width="{w}" height="{h}" fill="none" '
+                                  f'stroke="{color}" stroke-width="2" />')
+                if show_labels:
+                    shapes.append(f'<text x="{x}" y="{max(y - 4, 12)}" fill="{color}" font-size="{max(12, trunc(height / 40))}">'
+                                  f'{escape(str(category.get("name", annotation["category_id"])))}</text>')
+
+        return (f'<div style="position: relative; width: {thumb_width}px; height: {thumb_height}px;">'
+                f'<img src="data:image/jpeg;base64,{thumbnail}" width="{thumb_width}" height="{thumb_height}" '
+                f'style="position: absolute; top: 0; left: 0;" />'
+                f'<svg viewBox="0 0 {width} {height}" width="{thumb_width}" height="{thumb_height}" '
+                f'style="position: absolute; top: 0; left: 0;">{"".join(shapes)}</svg></div>')
+
+    def thumbnail(self, image_id, use_url=False, max_size=800):
+        # (base64 JPEG, width, height), encoded once per image and size
+        key = (image_id, use_url, max_size)
+        cached = _lru_get(self._thumbnails, key)
+        if cached is not None:
+            return cached
+
+        image = self.images[image_id]
+        if use_url:
+            response = requests.get(image.get('coco_url') or image['flickr_url'], timeout=30)
+            response.raise_for_status()
+            img = Image.open(BytesIO(response.content))
+        else:
+            img = Image.open(os.path.join(self.image_dir, image['file_name']))
+        with img:
+            # draft lets the JPEG decoder skip straight to a reduced size
+            img.draft('RGB', (max_size, max_size))
+            img = img.convert('RGB')
+            img.thumbnail((max_size, max_size))
+            buffer = BytesIO()
+            img.save(buffer, format='JPEG', quality=85)
+            cached = (base64.b64encode(buffer.getvalue()).decode('ascii'), img.width, img.height)
+
+        _lru_put(self._thumbnails, key, cached, self.thumbnail_cache_size)
+        return cached
 
+    def mask(self, annotation_id):
+        # Binary mask of one annotation, decoded on first use; ids are unique within this file
+        annotation = self.annotations_by_id[annotation_id]
+        image = self.images[annotation['image_id']]
+        return self.mask_cache.get_or_decode(
+            annotation_id, lambda: decode_segmentation(annotation['segmentation'], image['height'], image['width']))
+
+    def mask_png_base64(self, annotation_id, color):
+        # Base64 PNG overlay of one mask, encoded once per annotation and color
+        key = (annotation_id, color)
+        cached = _lru_get(self._overlays, key)
+        if cached is not None:
+            return cached
+
+        mask = self.mask(annotation_id)
+        overlay = Image.new('RGBA', (mask.shape[1], mask.shape[0]), color)
+        overlay.putalpha(Image.fromarray(mask * 110))
+        buffer = BytesIO()
+        overlay.save(buffer, format='PNG')
+        cached = base64.b64encode(buffer.getvalue()).decode('ascii')
+
+        _lru_put(self._overlays, key, cached, self.overlay_cache_size)
+        return cached
+
+    def annotations(self, rows):
+        return [self.annotation_list[row] for row in rows]
+
+    def _sorted_range(self, order, sorted_values, low, high):
+        # Rows whose value is in [low, high], found by binary search on a presorted column
+        start = np.searchsorted(sorted_values, low, side='left')
+        end = np.searchsorted(sorted_values, high, side='right')
+        return order[start:end]
+
+    def rows_for_image(self, image_id):
+        return self._sorted_range(self.image_order, self.sorted_image_ids, image_id, image_id)
+
+    def rows_for_category(self, category_id):
+        return self._sorted_range(self.category_order, self.sorted_category_ids, category_id, category_id)
+
+    def rows_for_super_category(self, super_category):
+        category_ids = sorted(self.super_categories.get(super_category, ()))
+        if not category_ids:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self.rows_for_category(category_id) for category_id in category_ids])
+
+    def query(self, image_id=None, category_id=None, super_category=None, area=None, width=None, height=None,
+              iscrowd=None):
+        """Annotations matching every given filter, in file order.
+
+        area, width and height are (low, high) ranges, inclusive, with None
+        for an open end; width and height are those of the bbox. Image,
+        category, supercategory and area narrow the candidates through
+        sorted indexes; the remaining filters are vectorized over them.
+        """
+        candidates = []
+        if image_id is not None:
+            candidates.append(self.rows_for_image(image_id))
+        if category_id is not None:
+            candidates.append(self.rows_for_category(category_id))
+        if super_category is not None:
+            candidates.append(self.rows_for_super_category(super_category))
+        if area is not None:
+            low, high = (-np.inf if area[0] is None else area[0]), (np.inf if area[1] is None else area[1])
+            candidates.append(self._sorted_range(self.area_order, self.sorted_areas, low, high))
+
+        if candidates:
+            rows = np.sort(candidates[0])
+            for other in candidates[1:]:
+                rows = np.intersect1d(rows, other, assume_unique=True)
+        else:
+            rows = np.arange(len(self.annotation_list))
+
+        keep = np.ones(len(rows), dtype=bool)
+        for column, value_range in ((2, width), (3, height)):
+            if value_range is not None:
+                values = self.ann_bboxes[rows, column]
+                if value_range[0] is not None:
+                    keep &= values >= value_range[0]
+                if value_range[1] is not None:
+                    keep &= values <= value_range[1]
+        if iscrowd is not None:
+            keep &= self.ann_iscrowd[rows] == int(iscrowd)
+        return self.annotations(rows[keep].tolist())
 
     def process_info(self):
-        self.info = self.coco['info']
+        self.info = self.coco.get('info', {})
 
     def process_licenses(self):
-        self.licenses = self.coco['licenses']
+        self.licenses = self.coco.get('licenses', [])
 
     def process_categories(self):
         self.categories = {}
         self.super_categories = {}
         for category in self.coco['categories']:
             cat_id = category['id']
-            super_category = category['supercategory']
+            super_category = category.get('supercategory')
 
             # Add category to the categories dict
             if cat_id not in self.categories:
@@ -114,20 +298,40 @@ class CocoDataset():
                 self.images[image_id] = image
 
     def process_segmentations(self):
+        # Annotations per image (the segmentations dict) and by id, plus numeric
+        # columns with sort orders for binary-searched lookups
+        self.annotation_list = self.coco.get('annotations', [])
         self.segmentations = {}
-        for segmentation in self.coco['segmentations']:
-            image_id = segmentation['image_id']
+        self.annotations_by_id = {}
+        for annotation in self.annotation_list:
+            image_id = annotation['image_id']
             if image_id not in self.segmentations:
                 self.segmentations[image_id] = []
-            self.segmentations[image_id].append(segmentation)
+            self.segmentations[image_id].append(annotation)
+            self.annotations_by_id[annotation['id']] = annotation
+
+        count = len(self.annotation_list)
+        self.ann_image_ids = np.fromiter((ann['image_id'] for ann in self.annotation_list), dtype=np.int64, count=count)
+        self.ann_category_ids = np.fromiter((ann['category_id'] for ann in self.annotation_list), dtype=np.int64, count=count)
+        self.ann_areas = np.fromiter((ann.get('area', 0) for ann in self.annotation_list), dtype=np.float64, count=count)
+        self.ann_iscrowd = np.fromiter((ann.get('iscrowd', 0) for ann in self.annotation_list), dtype=np.int8, count=count)
+        self.ann_bboxes = np.array([ann.get('bbox') or (0, 0, 0, 0) for ann in self.annotation_list],
+                                   dtype=np.float64).reshape(count, 4)
 
+        self.image_order = np.argsort(self.ann_image_ids, kind='stable')
+        self.sorted_image_ids = self.ann_image_ids[self.image_order]
+        self.category_order = np.argsort(self.ann_category_ids, kind='stable')
+        self.sorted_category_ids = self.ann_category_ids[self.category_order]
+        self.area_order = np.argsort(self.ann_areas, kind='stable')
+        self.sorted_areas = self.ann_areas[self.area_order]
 
-annotation_path = 'trainPart_coco.json'
-image_dir = 'trainPart'
 
-coco_dataset = CocoDataset(annotation_path, image_dir)
+if __name__ == '__main__':
+    annotation_path = 'trainPart_coco.json'
+    image_dir = 'trainPart'
 
+    coco_dataset = CocoDataset(annotation_path, image_dir)
 
-html = coco_dataset.display_image(use_url=False)
-IPython.display.HTML(html)
+    html = coco_dataset.display_image(use_url=False)
+    IPython.display.HTML(html)
  
\ No newline at end of file
@@ -0,0 +1,63 @@
+import copy
+import time
+import argparse
+
+import numpy as np
+from jsonschema import FormatChecker, validate
+
+from multikeypoint_example import CompiledValidator, schema_for_multikeypoint
+from pose_postprocess import postprocess_pose_keypoints
+
+
+def validate_multikeypoint_legacy(data):
+    # The previous per-call behaviour: fresh schema, fresh FormatChecker, schema re-checked by validate()
+    schema = copy.deepcopy(schema_for_multikeypoint)
+    try:
+        validate(data, schema, format_checker=FormatChecker())
+        return True
+    except Exception:
+        return False
+
+
+def make_payloads(count, people, seed=0):
+    # Realistic payloads: the predictor's postprocessing applied to random keypoints
+    rng = np.random.default_rng(seed)
+    payloads = []
+    for _ in range(count):
+        keypoints = np.empty((people, 17, 3))
+        keypoints[:, :, 0] = rng.uniform(1, 1000, (people, 17))
+        keypoints[:, :, 1] = rng.uniform(1, 760, (people, 17))
+        keypoints[:, :, 2] = rng.uniform(0, 1, (people, 17))
+        payloads.append({
+            "bboxes": postprocess_pose_keypoints(keypoints),
+            "image": {"rotation": 0, "image_width": 1000, "image_height": 761},
+        })
+    return payloads
+
+
+def measure(name, function, payloads, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(payloads)
+        best = min(best, time.perf_counter() - start)
+    print(f'{name:<28} {len(payloads) / best:>12.0f} docs/s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare multikeypoint validation throughput')
+    parser.add_argument('--count', type=int, default=200, help='Number of payloads')
+    parser.add_argument('--people', type=int, default=5, help='People per payload')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per method; the best one is reported')
+    args = parser.parse_args()
+
+    payloads = make_payloads(args.count, args.people)
+    compiled = CompiledValidator(schema_for_multikeypoint, use_fast=False)
+    fast = CompiledValidator(schema_for_multikeypoint)
+
+    measure('legacy validate()', lambda docs: [validate_multikeypoint_legacy(d) for d in docs], payloads, args.repeat)
+    measure('compiled jsonschema', compiled.validate_many, payloads, args.repeat)
+    if fast.fast_check is not None:
+        measure('compiled fastjsonschema', fast.validate_many, payloads, args.repeat)
+    else:
+        print('fastjsonschema is not installed, skipping the generated checker')
@@ -0,0 +1,36 @@
+import threading
+from multiprocessing import Pool
+
+
+def imap_bounded(function, tasks, workers, chunksize=4, ordered=False, initializer=None, initargs=()):
+    """Pool.imap_unordered over a lazy task iterable with a cap on tasks in flight.
+
+    Tasks are pulled from the iterable only as results come back, so
+    memory stays flat however many tasks there are. With ordered=True
+    results come back in task order (Pool.imap); finished results waiting
+    behind a slow task still count as in flight. If the consumer stops or
+    a task raises, the feeder is unblocked so the pool shuts down instead
+    of hanging.
+    """
+    max_in_flight = workers * chunksize * 2
+    in_flight = threading.Semaphore(max_in_flight)
+    stopped = threading.Event()
+
+    def bounded(tasks):
+        for task in tasks:
+            in_flight.acquire()
+            if stopped.is_set():
+                return
+            yield task
+
+    with Pool(workers, initializer=initializer, initargs=initargs) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        results = imap(function, bounded(tasks), chunksize=chunksize)
+        try:
+            for result in results:
+                in_flight.release()
+                yield result
+        finally:
+            # Unblock the task feeder so the pool can shut down on errors
+            stopped.set()
+            in_flight.release(max_in_flight)
@@ -1,61 +1,49 @@
-import json
 import os
 import argparse
-import numpy as np
-from PIL import Image, ImageDraw
-from tqdm import tqdm
-from pycocotools import mask as mask_util
 
-def convert_segmentation_to_mask(segmentation, width, height, category_id):
-    mask = Image.new('L', (width, height), 0)
-    draw = ImageDraw.Draw(mask)
-
-    if isinstance(segmentation, list):
-        for segment in segmentation:
-            draw.polygon(segment, outline=category_id, fill=category_id)
-        
-    elif isinstance(segmentation, dict) and 'counts' in segmentation and 'size' in segmentation:
-        rle = mask_util.frPyObjects(segmentation, height, width)
-        mask = mask_util.decode(rle)
-        
-    return np.array(mask)
+import coco_stream
+import mask_cache
+from coco_cache import open_coco
+from mask_renderer import render_masks, print_throughput
 
 def main(args):
-    with open(args.input_json, 'r') as f:
-        coco_data = json.load(f)
-
     output_dir = args.output_dir
     os.makedirs(output_dir, exist_ok=True)
-    
+    if args.mask_cache_dir:
+        # Decoded masks persist there, so later runs and other tools skip decoding
+        mask_cache.configure(spill_dir=args.mask_cache_dir, workers=args.workers)
+
+    if args.stream:
+        images = list(coco_stream.iter_images(args.input_json))
+    else:
+        # Uses the compiled cache when one is up to date, otherwise indexes the JSON
+        coco_index = open_coco(args.input_json)
+        images = coco_index.images
+
     # Check if --part_data argument is provided, and if so, limit the number of images to process
     if args.part_data:
-        coco_data['images'] = coco_data['images'][:args.part_data]
-    
-    for image_info in tqdm(coco_data['images']):
-        image_id = image_info['id']
-        file_name = image_info['file_name']
-        image_width = image_info['width']
-        image_height = image_info['height']
-
-        combined_mask = np.zeros((image_height, image_width), dtype=np.uint8)
+        images = images[:args.part_data]
 
-        for annotation in coco_data['annotations']:
-            if annotation['image_id'] == image_id:
-                segmentation = annotation['segmentation']
-                category_id = annotation['category_id']
-                mask = convert_segmentation_to_mask(segmentation, image_width, image_height, category_id)
-                combined_mask = np.maximum(combined_mask, mask)
+    if args.stream:
+        # Stream annotations one image at a time instead of loading the whole file
+        image_groups = coco_stream.iter_image_groups(args.input_json, images)
+    else:
+        image_groups = ((image_info, coco_index.annotations_for_image(image_info['id'])) for image_info in images)
 
-        image_mask_pil = Image.fromarray(combined_mask)
-        mask_file_name = os.path.splitext(file_name)[0] + '_combined_mask.png'
-        mask_path = os.path.join(output_dir, mask_file_name)
-        image_mask_pil.save(mask_path)
+    stats = render_masks(image_groups, output_dir, workers=args.workers,
+                         use_category_id=True, total=len(images))
+    print_throughput(stats)
+    if args.workers <= 1:
+        mask_cache.print_stats()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Convert COCO segmentation to masks")
-    parser.add_argument("--input_json", required=True, help="Path to COCO JSON file")
+    parser.add_argument("--input_json", required=True, help="Path to COCO JSON file or compiled cache directory")
     parser.add_argument("--output_dir", required=True, help="Directory to save output masks")
     parser.add_argument("--part_data", type=int, help="Number of images to convert (optional)")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes for rendering (default: 1, serial)")
+    parser.add_argument("--stream", action="store_true", help="Stream the JSON instead of loading it (for very large files)")
+    parser.add_argument("--mask_cache_dir", help="Directory to keep decoded masks in across runs (optional)")
     args = parser.parse_args()
 
     main(args)
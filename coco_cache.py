@@ -0,0 +1,426 @@
+import os
+import hashlib
+import argparse
+
+import numpy as np
+from tqdm import tqdm
+
+import coco_stream
+import json_io
+from coco_index import CocoIndex
+
+CACHE_VERSION = 4
+
+# Fields rebuilt from arrays; any other key of a record is kept as JSON in an extras buffer
+IMAGE_FIELDS = {'id', 'file_name', 'width', 'height'}
+ANNOTATION_FIELDS = {'id', 'image_id', 'category_id', 'segmentation', 'area', 'bbox', 'iscrowd',
+                     'keypoints', 'num_keypoints'}
+
+# Segmentation kinds stored in seg_kind
+SEG_NONE = 0
+SEG_POLYGON = 1
+SEG_RLE_COUNTS = 2  # uncompressed RLE, list of run lengths
+SEG_RLE_STRING = 3  # compressed RLE, LEB128-style string
+
+# Bits of int_flags: which values were ints in the source JSON
+INT_POLYGON = 1
+INT_BBOX = 2
+INT_AREA = 4
+INT_KEYPOINTS = 8
+
+
+def default_cache_dir(json_path):
+    return json_path + '.cache'
+
+
+def file_sha1(path, block_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _offsets(lengths):
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def _gather(flat, offsets, order):
+    # Reorder variable-length rows of an offset-indexed flat buffer
+    lengths = np.diff(offsets)[order]
+    new_offsets = _offsets(lengths)
+    index = np.repeat(offsets[:-1][order] - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+    return flat[index], new_offsets
+
+
+def _all_ints(values):
+    return all(isinstance(value, int) for value in values)
+
+
+def _extras(record, fields):
+    # Non-standard keys (e.g. iMaterialist's attribute ids) as compact JSON, b'' when there are none
+    extra = {key: value for key, value in record.items() if key not in fields}
+    return json_io.dumps_bytes(extra) if extra else b''
+
+
+def compile_cache(json_path, cache_dir=None):
+    """Compile a COCO JSON file into a columnar cache directory.
+
+    Images and annotations are stored as NumPy arrays, with polygon
+    points, RLE counts, keypoints and file names in flat buffers indexed
+    by offset arrays. Annotations are sorted by image id so the
+    annotations of an image are one contiguous slice. Keys beyond the
+    standard COCO fields are kept per record as JSON, so rebuilt records
+    carry everything the source had.
+    """
+    cache_dir = cache_dir or default_cache_dir(json_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    images = list(coco_stream.iter_images(json_path))
+    image_ids = np.array([image['id'] for image in images], dtype=np.int64)
+    image_widths = np.array([image['width'] for image in images], dtype=np.int32)
+    image_heights = np.array([image['height'] for image in images], dtype=np.int32)
+    names = [image['file_name'].encode('utf-8') for image in images]
+    file_name_offsets = _offsets([len(name) for name in names])
+    file_name_bytes = np.frombuffer(b''.join(names), dtype=np.uint8)
+    image_extras = [_extras(image, IMAGE_FIELDS) for image in images]
+    image_extra_offsets = _offsets([len(extra) for extra in image_extras])
+    image_extra_bytes = np.frombuffer(b''.join(image_extras), dtype=np.uint8)
+
+    ann_ids = []
+    ann_image_ids = []
+    category_ids = []
+    bboxes = []
+    areas = []
+    iscrowds = []
+    seg_kinds = []
+    int_flags = []
+    rle_sizes = []
+    polygons_per_ann = []
+    points_per_polygon = []
+    points = []
+    rle_lengths = []
+    rle_counts = []
+    rle_string_lengths = []
+    rle_strings = []
+    keypoint_lengths = []
+    keypoints = []
+    num_keypoints = []
+    extra_lengths = []
+    extras = []
+
+    for annotation in tqdm(coco_stream.iter_annotations(json_path), desc='Compiling annotations'):
+        ann_ids.append(annotation['id'])
+        ann_image_ids.append(annotation['image_id'])
+        category_ids.append(annotation['category_id'])
+        bbox = annotation.get('bbox') or [0, 0, 0, 0]
+        bboxes.append(bbox)
+        area = annotation.get('area', 0)
+        areas.append(area)
+        iscrowds.append(annotation.get('iscrowd', 0))
+
+        flags = (INT_BBOX if _all_ints(bbox) else 0) | (INT_AREA if isinstance(area, int) else 0)
+        segmentation = annotation.get('segmentation')
+        num_polygons = 0
+        rle_length = 0
+        rle_string_length = 0
+        size = (0, 0)
+        if isinstance(segmentation, list):
+            kind = SEG_POLYGON
+            num_polygons = len(segmentation)
+            polygon_ints = True
+            for polygon in segmentation:
+                points_per_polygon.append(len(polygon))
+                points.extend(polygon)
+                polygon_ints = polygon_ints and _all_ints(polygon)
+            if polygon_ints:
+                flags |= INT_POLYGON
+        elif isinstance(segmentation, dict):
+            size = segmentation['size']
+            if isinstance(segmentation['counts'], list):
+                kind = SEG_RLE_COUNTS
+                rle_length = len(segmentation['counts'])
+                rle_counts.extend(segmentation['counts'])
+            else:
+                kind = SEG_RLE_STRING
+                counts = segmentation['counts']
+                counts = counts.encode('ascii') if isinstance(counts, str) else counts
+                rle_string_length = len(counts)
+                rle_strings.append(counts)
+        else:
+            kind = SEG_NONE
+
+        annotation_keypoints = annotation.get('keypoints') or []
+        if annotation_keypoints and _all_ints(annotation_keypoints):
+            flags |= INT_KEYPOINTS
+
+        seg_kinds.append(kind)
+        int_flags.append(flags)
+        rle_sizes.append(size)
+        polygons_per_ann.append(num_polygons)
+        rle_lengths.append(rle_length)
+        rle_string_lengths.append(rle_string_length)
+
+        keypoint_lengths.append(len(annotation_keypoints))
+        keypoints.extend(annotation_keypoints)
+        # Stored as given (-1 when absent) rather than recomputed from the keypoints
+        num_keypoints.append(annotation.get('num_keypoints', -1))
+        extra = _extras(annotation, ANNOTATION_FIELDS)
+        extra_lengths.append(len(extra))
+        extras.append(extra)
+
+    # Sort annotations by image id so each image owns one contiguous slice
+    ann_image_ids = np.array(ann_image_ids, dtype=np.int64)
+    order = np.argsort(ann_image_ids, kind='stable')
+
+    polygon_offsets = _offsets(polygons_per_ann)
+    point_offsets = _offsets(points_per_polygon)
+    polygon_order, polygon_offsets = _gather(np.arange(len(points_per_polygon)), polygon_offsets, order)
+    points, point_offsets = _gather(np.array(points, dtype=np.float64), point_offsets, polygon_order)
+    rle_counts, rle_offsets = _gather(np.array(rle_counts, dtype=np.uint32), _offsets(rle_lengths), order)
+    rle_bytes = np.frombuffer(b''.join(rle_strings), dtype=np.uint8)
+    rle_bytes, rle_string_offsets = _gather(rle_bytes, _offsets(rle_string_lengths), order)
+    keypoints, keypoint_offsets = _gather(np.array(keypoints, dtype=np.float64), _offsets(keypoint_lengths), order)
+    extra_bytes = np.frombuffer(b''.join(extras), dtype=np.uint8)
+    extra_bytes, extra_offsets = _gather(extra_bytes, _offsets(extra_lengths), order)
+
+    arrays = {
+        'image_ids': image_ids,
+        'image_widths': image_widths,
+        'image_heights': image_heights,
+        'file_name_bytes': file_name_bytes,
+        'file_name_offsets': file_name_offsets,
+        'image_extra_bytes': image_extra_bytes,
+        'image_extra_offsets': image_extra_offsets,
+        'ann_ids': np.array(ann_ids, dtype=np.int64)[order],
+        'ann_image_ids': ann_image_ids[order],
+        'ann_category_ids': np.array(category_ids, dtype=np.int64)[order],
+        'ann_bboxes': np.array(bboxes, dtype=np.float64).reshape(-1, 4)[order],
+        'ann_areas': np.array(areas, dtype=np.float64)[order],
+        'ann_iscrowd': np.array(iscrowds, dtype=np.uint8)[order],
+        'ann_seg_kinds': np.array(seg_kinds, dtype=np.uint8)[order],
+        'ann_int_flags': np.array(int_flags, dtype=np.uint8)[order],
+        'ann_rle_sizes': np.array(rle_sizes, dtype=np.int64).reshape(-1, 2)[order],
+        'polygon_offsets': polygon_offsets,
+        'point_offsets': point_offsets,
+        'points': points,
+        'rle_offsets': rle_offsets,
+        'rle_counts': rle_counts,
+        'rle_string_offsets': rle_string_offsets,
+        'rle_bytes': rle_bytes,
+        'keypoint_offsets': keypoint_offsets,
+        'keypoints': keypoints,
+        'ann_num_keypoints': np.array(num_keypoints, dtype=np.int64)[order],
+        'extra_offsets': extra_offsets,
+        'extra_bytes': extra_bytes,
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(cache_dir, name + '.npy'), array)
+
+    header = coco_stream.read_header(json_path)
+    stat = os.stat(json_path)
+    meta = {
+        'version': CACHE_VERSION,
+        'source': os.path.abspath(json_path),
+        'source_size': stat.st_size,
+        'source_mtime': stat.st_mtime,
+        'source_sha1': file_sha1(json_path),
+        'categories': header.get('categories', []),
+        'info': header.get('info'),
+        'licenses': header.get('licenses'),
+        # Every top-level value besides images and annotations, so outputs can carry them through
+        'header': header,
+    }
+    # meta.json is written last, so a cache without it is treated as missing
+    json_io.dump(meta, meta_path)
+
+    return cache_dir
+
+
+def read_meta(cache_dir):
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    return json_io.load(meta_path)
+
+
+def check_cache(json_path, cache_dir=None):
+    """'fresh', 'moved' or None for the cache of json_path; read-only.
+
+    'fresh' means size and mtime match the compiled source. 'moved' means
+    the mtime changed but the content hash still matches (e.g. after a
+    copy); open_coco then records the new mtime. Only in that case is
+    the file hashed.
+    """
+    cache_dir = cache_dir or default_cache_dir(json_path)
+    meta = read_meta(cache_dir)
+    if meta is None or meta.get('version') != CACHE_VERSION:
+        return None
+
+    stat = os.stat(json_path)
+    if stat.st_size == meta['source_size'] and stat.st_mtime == meta['source_mtime']:
+        return 'fresh'
+    if stat.st_size != meta['source_size'] or file_sha1(json_path) != meta['source_sha1']:
+        return None
+    return 'moved'
+
+
+def is_cache_valid(json_path, cache_dir=None):
+    # True when cache_dir was compiled from the current contents of json_path
+    return check_cache(json_path, cache_dir) is not None
+
+
+def refresh_source_mtime(json_path, cache_dir=None):
+    # Remember a new mtime for unchanged content, so later checks skip hashing
+    cache_dir = cache_dir or default_cache_dir(json_path)
+    meta = read_meta(cache_dir)
+    meta['source_mtime'] = os.stat(json_path).st_mtime
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    # Write then rename, so concurrent readers never see a partial file
+    tmp_path = f'{meta_path}.{os.getpid()}.tmp'
+    json_io.dump(meta, tmp_path)
+    os.replace(tmp_path, meta_path)
+
+
+class CocoCache():
+    # Read-only view over a compiled cache; arrays are memory-mapped, not read.
+    # Offers the same lookups as CocoIndex, building dicts only when asked.
+    # Rebuilt records carry the standard COCO fields plus any extra keys of the source records.
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.meta = read_meta(cache_dir)
+        if self.meta is None:
+            raise FileNotFoundError(f'No COCO cache in {cache_dir}')
+        if self.meta.get('version') != CACHE_VERSION:
+            raise ValueError(f'COCO cache in {cache_dir} has an old format; recompile it with coco_cache.py --force')
+
+        for file_name in os.listdir(cache_dir):
+            if file_name.endswith('.npy'):
+                setattr(self, file_name[:-4], np.load(os.path.join(cache_dir, file_name), mmap_mode='r'))
+
+        self.categories = self.meta['categories']
+        self.header = self.meta['header']
+        self._images = None
+        self._image_by_file_name = None
+
+    @property
+    def images(self):
+        if self._images is None:
+            self._images = [self.image_info(row) for row in range(len(self.image_ids))]
+        return self._images
+
+    def image_info(self, row):
+        start, end = self.file_name_offsets[row], self.file_name_offsets[row + 1]
+        image = {
+            'id': int(self.image_ids[row]),
+            'file_name': bytes(self.file_name_bytes[start:end]).decode('utf-8'),
+            'width': int(self.image_widths[row]),
+            'height': int(self.image_heights[row]),
+        }
+        start, end = self.image_extra_offsets[row], self.image_extra_offsets[row + 1]
+        if end > start:
+            image.update(json_io.loads(bytes(self.image_extra_bytes[start:end])))
+        return image
+
+    def annotation_rows(self, image_id):
+        # Annotations are sorted by image id, so this is a binary search
+        start = np.searchsorted(self.ann_image_ids, image_id, side='left')
+        end = np.searchsorted(self.ann_image_ids, image_id, side='right')
+        return range(int(start), int(end))
+
+    def polygons(self, row):
+        polygons = []
+        as_int = self.ann_int_flags[row] & INT_POLYGON
+        for polygon in range(self.polygon_offsets[row], self.polygon_offsets[row + 1]):
+            coords = self.points[self.point_offsets[polygon]:self.point_offsets[polygon + 1]]
+            polygons.append(coords.astype(np.int64).tolist() if as_int else coords.tolist())
+        return polygons
+
+    def segmentation(self, row):
+        kind = self.ann_seg_kinds[row]
+        if kind == SEG_POLYGON:
+            return self.polygons(row)
+        size = self.ann_rle_sizes[row].tolist()
+        if kind == SEG_RLE_COUNTS:
+            counts = self.rle_counts[self.rle_offsets[row]:self.rle_offsets[row + 1]]
+            return {'size': size, 'counts': counts.tolist()}
+        if kind == SEG_RLE_STRING:
+            counts = self.rle_bytes[self.rle_string_offsets[row]:self.rle_string_offsets[row + 1]]
+            return {'size': size, 'counts': bytes(counts).decode('ascii')}
+        return []
+
+    def annotation(self, row):
+        flags = self.ann_int_flags[row]
+        bbox = self.ann_bboxes[row]
+        area = self.ann_areas[row]
+        annotation = {
+            'id': int(self.ann_ids[row]),
+            'image_id': int(self.ann_image_ids[row]),
+            'category_id': int(self.ann_category_ids[row]),
+            'segmentation': self.segmentation(row),
+            'area': int(area) if flags & INT_AREA else float(area),
+            'bbox': bbox.astype(np.int64).tolist() if flags & INT_BBOX else bbox.tolist(),
+            'iscrowd': int(self.ann_iscrowd[row]),
+        }
+        start, end = self.keypoint_offsets[row], self.keypoint_offsets[row + 1]
+        if end > start:
+            keypoints = self.keypoints[start:end]
+            annotation['keypoints'] = keypoints.astype(np.int64).tolist() if flags & INT_KEYPOINTS else keypoints.tolist()
+        if self.ann_num_keypoints[row] >= 0:
+            annotation['num_keypoints'] = int(self.ann_num_keypoints[row])
+        start, end = self.extra_offsets[row], self.extra_offsets[row + 1]
+        if end > start:
+            annotation.update(json_io.loads(bytes(self.extra_bytes[start:end])))
+        return annotation
+
+    def annotations_for_image(self, image_id):
+        return [self.annotation(row) for row in self.annotation_rows(image_id)]
+
+    def annotations_for_category(self, category_id):
+        rows = np.flatnonzero(self.ann_category_ids == category_id)
+        return [self.annotation(row) for row in rows]
+
+    def image_for_file_name(self, file_name):
+        if self._image_by_file_name is None:
+            self._image_by_file_name = {image['file_name']: image for image in self.images}
+        return self._image_by_file_name.get(file_name)
+
+    def iter_image_groups(self):
+        for image in self.images:
+            yield image, self.annotations_for_image(image['id'])
+
+
+def open_coco(path, use_cache=True):
+    """Open a COCO dataset for indexed access.
+
+    path may be a JSON file or a compiled cache directory. For a JSON file
+    a valid cache next to it is used when present; otherwise the JSON is
+    loaded and indexed with CocoIndex.
+    """
+    if os.path.isdir(path):
+        return CocoCache(path)
+    if use_cache:
+        state = check_cache(path)
+        if state == 'moved':
+            refresh_source_mtime(path)
+        if state is not None:
+            return CocoCache(default_cache_dir(path))
+    return CocoIndex(coco_stream.load_coco(path))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile a COCO JSON file into a memory-mapped columnar cache')
+    parser.add_argument('--input_json', required=True, help='Path to the COCO JSON file')
+    parser.add_argument('--cache_dir', help='Output directory (default: <input_json>.cache)')
+    parser.add_argument('--force', action='store_true', help='Recompile even if the cache is up to date')
+    args = parser.parse_args()
+
+    if not args.force and is_cache_valid(args.input_json, args.cache_dir):
+        print(f'Cache for {args.input_json} is up to date')
+    else:
+        print(f'Cache written to {compile_cache(args.input_json, args.cache_dir)}')
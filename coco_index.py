@@ -0,0 +1,38 @@
+from collections import defaultdict
+
+
+class CocoIndex():
+    # Lookup tables over a loaded COCO dict, built in a single pass over
+    # images and annotations so per-image queries don't rescan the dataset.
+    def __init__(self, coco_data):
+        self.coco_data = coco_data
+        self.images = coco_data.get('images', [])
+        self.categories = coco_data.get('categories', [])
+        # info, licenses, categories and any other top-level value
+        self.header = {key: value for key, value in coco_data.items() if key not in ('images', 'annotations')}
+
+        self.image_by_id = {}
+        self.image_by_file_name = {}
+        for image in self.images:
+            self.image_by_id[image['id']] = image
+            self.image_by_file_name[image['file_name']] = image
+
+        self.anns_by_image = defaultdict(list)
+        self.anns_by_category = defaultdict(list)
+        for annotation in coco_data.get('annotations', []):
+            self.anns_by_image[annotation['image_id']].append(annotation)
+            self.anns_by_category[annotation['category_id']].append(annotation)
+
+    def annotations_for_image(self, image_id):
+        return self.anns_by_image.get(image_id, [])
+
+    def annotations_for_category(self, category_id):
+        return self.anns_by_category.get(category_id, [])
+
+    def image_for_file_name(self, file_name):
+        return self.image_by_file_name.get(file_name)
+
+    def iter_image_groups(self):
+        # Yields (image_info, annotations) in the order of coco_data['images']
+        for image in self.images:
+            yield image, self.annotations_for_image(image['id'])
@@ -0,0 +1,164 @@
+import random
+from collections import defaultdict
+
+import numpy as np
+
+import coco_stream
+
+
+class Reservoir():
+    # Uniform sample of size k over a stream of unknown length (Algorithm R)
+    def __init__(self, k, rng):
+        self.k = k
+        self.rng = rng
+        self.items = []
+        self.seen = 0
+
+    def add(self, item):
+        if self.seen < self.k:
+            self.items.append(item)
+        else:
+            slot = self.rng.randrange(self.seen + 1)
+            if slot < self.k:
+                self.items[slot] = item
+        self.seen += 1
+
+
+def _category_seed(seed, rng):
+    # Unseeded runs draw one from rng, so they differ from run to run like the uniform picks
+    return seed if seed is not None else rng.getrandbits(64)
+
+
+def _category_rng(seed, category_id):
+    # One generator per category, so a category's picks don't depend on how categories interleave
+    return random.Random(f'{seed}:{category_id}')
+
+
+def _pick(uniform_ids, stratified_ids, num_samples, rng):
+    # Every stratified image, topped up with uniformly sampled ones to num_samples
+    fill = [image_id for image_id in uniform_ids if image_id not in stratified_ids]
+    rng.shuffle(fill)
+    return set(stratified_ids) | set(fill[:max(0, num_samples - len(stratified_ids))])
+
+
+def _subset(header, images, annotations_by_image):
+    images = sorted(images, key=lambda image: image['id'])
+    subset = {key: value for key, value in header.items() if value is not None}
+    subset['images'] = images
+    subset['annotations'] = [ann for image in images for ann in annotations_by_image.get(image['id'], [])]
+    return subset
+
+
+def sample_coco_stream(path, num_samples, seed=None, min_per_category=0):
+    """Sample num_samples images (with their annotations) from a COCO JSON file.
+
+    A first pass reservoir-samples the images and reads only image_id and
+    category_id of every annotation, plus info, licenses and categories.
+    With min_per_category > 0 a per-category reservoir of annotations picks
+    images so that every category has at least that many instances in the
+    subset (when the file has them); the rest is filled uniformly. A second
+    pass collects the annotations of the picked images (and the picked
+    images the reservoir did not keep). The stratified images are always
+    kept, so when they alone are more than num_samples the subset is
+    larger than num_samples. The same seed gives the same subset.
+    info, licenses and categories are kept when present.
+    """
+    rng = random.Random(seed)
+    category_seed = _category_seed(seed, rng)
+    image_reservoir = Reservoir(num_samples, rng)
+    category_reservoirs = {}
+    header = {'info': None, 'licenses': None, 'categories': []}
+    for key, value in coco_stream.iter_top_level(path, annotation_fields=('image_id', 'category_id')):
+        if key == 'images':
+            image_reservoir.add(value)
+        elif key == 'annotations':
+            if min_per_category > 0:
+                image_id, category_id = value
+                if category_id not in category_reservoirs:
+                    category_reservoirs[category_id] = Reservoir(min_per_category,
+                                                                 _category_rng(category_seed, category_id))
+                category_reservoirs[category_id].add(image_id)
+        elif key in header:
+            header[key] = value
+    images_by_id = {image['id']: image for image in image_reservoir.items}
+
+    stratified_ids = {image_id for reservoir in category_reservoirs.values() for image_id in reservoir.items}
+    selected = _pick(list(images_by_id), stratified_ids, num_samples, rng)
+
+    missing = selected - set(images_by_id)
+    annotations_by_image = defaultdict(list)
+    sections = ('images', 'annotations') if missing else ('annotations',)
+    for key, value in coco_stream.iter_top_level(path, sections=sections):
+        if key == 'annotations':
+            if value['image_id'] in selected:
+                annotations_by_image[value['image_id']].append(value)
+        elif value['id'] in missing:
+            images_by_id[value['id']] = value
+    coco_stream.release_fallback()
+
+    return _subset(header, [images_by_id[image_id] for image_id in selected if image_id in images_by_id],
+                   annotations_by_image)
+
+
+def sample_coco_index(coco, num_samples, seed=None, min_per_category=0):
+    """Same sampling over an indexed dataset (CocoCache or CocoIndex).
+
+    Only the sampled images and their annotations are materialized, through
+    the index's per-row and per-image lookups.
+    """
+    rng = random.Random(seed)
+    category_seed = _category_seed(seed, rng)
+    compiled = hasattr(coco, 'image_ids')
+    if compiled:
+        # Compiled cache: ids are arrays, image dicts are only built for picked rows
+        image_ids = np.asarray(coco.image_ids)
+        id_order = np.argsort(image_ids, kind='stable')
+        sorted_ids = image_ids[id_order]
+        category_ids = np.asarray(coco.ann_category_ids)
+        ann_image_ids = np.asarray(coco.ann_image_ids)
+    else:
+        image_ids = [image['id'] for image in coco.images]
+
+    image_reservoir = Reservoir(num_samples, rng)
+    for row in range(len(image_ids)):
+        image_reservoir.add(row)
+    uniform_ids = [int(image_ids[row]) for row in image_reservoir.items]
+
+    stratified_ids = set()
+    if min_per_category > 0:
+        known = {category['id'] for category in coco.categories}
+        if compiled:
+            # One stable sort splits the annotations' image ids by category
+            order = np.argsort(category_ids, kind='stable')
+            groups, starts = np.unique(category_ids[order], return_index=True)
+            per_category = zip(groups.tolist(), np.split(ann_image_ids[order], starts[1:]))
+            per_category = ((category_id, ids.tolist()) for category_id, ids in per_category)
+        else:
+            per_category = ((category_id, [annotation['image_id'] for annotation in annotations])
+                            for category_id, annotations in coco.anns_by_category.items())
+        for category_id, ids in per_category:
+            if category_id not in known:
+                continue
+            reservoir = Reservoir(min_per_category, _category_rng(category_seed, category_id))
+            for image_id in ids:
+                reservoir.add(image_id)
+            stratified_ids.update(reservoir.items)
+
+    selected = _pick(uniform_ids, stratified_ids, num_samples, rng)
+    if compiled:
+        # Annotations may name images that are not in the images list; those are skipped
+        wanted = np.array(sorted(selected), dtype=np.int64)
+        positions = np.minimum(np.searchsorted(sorted_ids, wanted), max(len(sorted_ids) - 1, 0))
+        found = positions[sorted_ids[positions] == wanted] if len(sorted_ids) else positions[:0]
+        images = [coco.image_info(int(row)) for row in id_order[found]]
+    else:
+        images = [coco.image_by_id[image_id] for image_id in selected if image_id in coco.image_by_id]
+    annotations_by_image = {image['id']: coco.annotations_for_image(image['id']) for image in images}
+
+    meta = getattr(coco, 'meta', None) or getattr(coco, 'coco_data', {})
+    header = {
+        'info': meta.get('info'),
+        'licenses': meta.get('licenses'),
+        'categories': coco.categories,
+    }
+    return _subset(header, images, annotations_by_image)
@@ -0,0 +1,209 @@
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+import os
+import threading
+
+import json_io
+
+# Without ijson the whole file is parsed once and shared by every section read;
+# keyed by path, size and mtime so an edited file is parsed again
+_fallback_lock = threading.Lock()
+_fallback_key = None
+_fallback_data = None
+
+
+def load_coco(path):
+    # Full load, with orjson when it is installed
+    return json_io.load(path)
+
+
+def _load_shared(path):
+    global _fallback_key, _fallback_data
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _fallback_lock:
+        if key != _fallback_key:
+            _fallback_key, _fallback_data = None, None
+            _fallback_data = load_coco(path)
+            _fallback_key = key
+        return _fallback_data
+
+
+def release_fallback():
+    # Drop the shared parse once a caller is done streaming a file without ijson
+    global _fallback_key, _fallback_data
+    with _fallback_lock:
+        _fallback_key, _fallback_data = None, None
+
+
+def iter_section(path, section):
+    """Yield the items of one top-level list ('images', 'annotations', ...).
+
+    With ijson installed the file is parsed incrementally, so only the
+    current item is held in memory. Without it the whole file is parsed
+    once and kept for later calls on the same path (see
+    release_fallback), so a caller reading several sections, or making
+    several passes, still pays for a single parse.
+    """
+    if ijson is None:
+        yield from _load_shared(path).get(section, [])
+        return
+    with open(path, 'rb') as f:
+        yield from ijson.items(f, f'{section}.item', use_float=True)
+
+
+def iter_images(path):
+    return iter_section(path, 'images')
+
+
+def iter_categories(path):
+    return iter_section(path, 'categories')
+
+
+def iter_annotations(path):
+    return iter_section(path, 'annotations')
+
+
+def read_value(path, key, default=None):
+    # Top-level value such as 'info' or 'licenses', None/default when missing;
+    # the file is only read up to the end of that value
+    for _, value in iter_top_level(path, sections=(key,)):
+        return value
+    return default
+
+
+def _fallback_top_level(path, sections, annotation_fields, skip):
+    data = _load_shared(path)
+    for key, value in data.items():
+        if (sections is not None and key not in sections) or key in skip:
+            continue
+        if key == 'annotations' and annotation_fields is not None:
+            for annotation in value:
+                yield key, tuple(annotation.get(field) for field in annotation_fields)
+        elif key in ('images', 'annotations'):
+            for item in value:
+                yield key, item
+        else:
+            yield key, value
+
+
+def iter_top_level(path, sections=None, annotation_fields=None, skip=()):
+    """Read a COCO file in one pass, yielding (key, value) pairs in file order.
+
+    Items of 'images' and 'annotations' are yielded one at a time as
+    (section, item); any other top-level value ('info', 'categories', ...)
+    is yielded whole. With annotation_fields, annotations are yielded as
+    tuples of those fields (None when missing) and nothing else of them,
+    such as segmentations, is built. sections limits which top-level
+    keys are built and keys in skip are never built; the rest is only
+    parsed over.
+    """
+    if ijson is None:
+        yield from _fallback_top_level(path, sections, annotation_fields, skip)
+        return
+
+    with open(path, 'rb') as f:
+        key = None
+        builder = None
+        fields = None
+        for prefix, event, value in ijson.parse(f, use_float=True):
+            if prefix == '':
+                if event == 'map_key':
+                    key = value
+                continue
+            if (sections is not None and key not in sections) or key in skip:
+                continue
+
+            if key in ('images', 'annotations'):
+                if prefix == key:
+                    continue  # start_array / end_array of the section
+                if key == 'annotations' and annotation_fields is not None:
+                    if prefix == 'annotations.item':
+                        if event == 'start_map':
+                            fields = {}
+                        elif event == 'end_map':
+                            yield key, tuple(fields.get(field) for field in annotation_fields)
+                    elif event not in ('start_map', 'start_array', 'end_map', 'end_array', 'map_key'):
+                        field = prefix[len('annotations.item.'):]
+                        if field in annotation_fields:
+                            fields[field] = value
+                    continue
+                item_prefix = key + '.item'
+            else:
+                item_prefix = key
+
+            # Build one item (or one whole top-level value) from its events
+            if prefix == item_prefix and event in ('start_map', 'start_array'):
+                builder = ijson.ObjectBuilder()
+            if builder is None:
+                if prefix == item_prefix:
+                    yield key, value  # scalar
+                continue
+            builder.event(event, value)
+            if prefix == item_prefix and event in ('end_map', 'end_array'):
+                yield key, builder.value
+                builder = None
+
+
+def read_header(path):
+    # Every top-level value except the images and annotations lists, in file order
+    return dict(iter_top_level(path, skip=('images', 'annotations')))
+
+
+def iter_image_groups(path, images=None, assume_grouped=True):
+    """Yield (image_info, annotations) for every image in the file.
+
+    Annotations are streamed and yielded one image at a time, so peak
+    memory is the image list plus one image's annotations. That relies on
+    annotations of an image being stored next to each other, which is how
+    COCO exports are written; a ValueError is raised if an image shows up
+    again after its group was yielded. Pass assume_grouped=False for files
+    in arbitrary order, which buffers all annotations instead. Images
+    without annotations come last, with an empty list. Without ijson the
+    shared parse is released once iteration ends.
+    """
+    try:
+        yield from _iter_image_groups(path, images, assume_grouped)
+    finally:
+        release_fallback()
+
+
+def _iter_image_groups(path, images, assume_grouped):
+    if images is None:
+        images = list(iter_images(path))
+    images_by_id = {image['id']: image for image in images}
+    emitted = set()
+
+    if not assume_grouped:
+        groups = {}
+        for annotation in iter_annotations(path):
+            groups.setdefault(annotation['image_id'], []).append(annotation)
+        for image in images:
+            yield image, groups.pop(image['id'], [])
+        return
+
+    current_id = None
+    current = []
+    for annotation in iter_annotations(path):
+        image_id = annotation['image_id']
+        if image_id != current_id:
+            if current_id is not None and current_id in images_by_id:
+                emitted.add(current_id)
+                yield images_by_id[current_id], current
+            if image_id in emitted:
+                raise ValueError(f'Annotations of image {image_id} are not stored together in {path}; '
+                                 'use assume_grouped=False')
+            current_id = image_id
+            current = []
+        current.append(annotation)
+
+    if current_id is not None and current_id in images_by_id:
+        emitted.add(current_id)
+        yield images_by_id[current_id], current
+
+    for image in images:
+        if image['id'] not in emitted:
+            yield image, []
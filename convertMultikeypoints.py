@@ -1,22 +1,23 @@
 import argparse
-import json
 import uuid
 from tqdm import tqdm
 
+import coco_stream
+import json_io
+
 def convert_to_correct_base_format(coco_json_path):
-    with open(coco_json_path, 'r') as coco_file:
-        coco_data = json.load(coco_file)
+    first_image = next(coco_stream.iter_images(coco_json_path))
 
     base_data = {
         "bboxes": [],
         "image": {
             "rotation": 0,  # Assuming rotation is 0
-            "image_width": coco_data['images'][0]['width'],
-            "image_height": coco_data['images'][0]['height']
+            "image_width": first_image['width'],
+            "image_height": first_image['height']
         }
     }
 
-    for annotation in tqdm(coco_data['annotations'], desc='Converting', unit='annotations'):
+    for annotation in tqdm(coco_stream.iter_annotations(coco_json_path), desc='Converting', unit='annotations'):
         keypoints = annotation['keypoints']
         num_keypoints = len(keypoints) // 3
 
@@ -45,11 +46,11 @@ def convert_to_correct_base_format(coco_json_path):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Convert COCO JSON file to correct base JSON format.")
     parser.add_argument("--coco_json", help="Path to the input COCO JSON file.")
+    parser.add_argument("--pretty", action="store_true", help="Indent the output JSON file.")
     args = parser.parse_args()
 
     # output_json = args.coco_json.replace(".json", "_correct_base_format.json")
     base_data = convert_to_correct_base_format(args.coco_json)
 
     output_json = "base_format.json"
-    with open(output_json, 'w') as output_file:
-        json.dump(base_data, output_file, indent=4)
+    json_io.dump(base_data, output_json, pretty=args.pretty)
@@ -1,34 +1,20 @@
-import json
 import argparse
 import numpy as np
 import pandas as pd
 from PIL import Image
 from tqdm import tqdm
 
-from utils import get_binary_mask, get_bbox, convert_to_coco_rle, binary_mask_to_rle
+import json_io
+import rle_tools
+from bounded_pool import imap_bounded
 
 
-parser = argparse.ArgumentParser(description='Convert iMaterialist csv format to COCO json format')
+def load_label_descriptions(label_desc_path='label_descriptions.json'):
+    label_desc = json_io.load(label_desc_path)
 
-parser.add_argument('--csv_path', type=str, help='Path to the CSV file')
-parser.add_argument('--output_json_path', type=str, help='Path to the output filtered CSV file')
-
-args = parser.parse_args()
-
-
-with open('label_descriptions.json') as f:
-    label_desc = json.load(f)
-    
-cat_df = pd.DataFrame(label_desc['categories']).set_index('id').sort_index()
-attr_df = pd.DataFrame(label_desc['attributes']).set_index('id').sort_index()
-
-# Loading Dataset
-
-# train_df = pd.read_csv('train.csv')
-train_df = pd.read_csv(args.csv_path)
-train_df['AttributesIds'] = train_df['AttributesIds'].fillna('')
-print(len(train_df))
-train_df.head()
+    cat_df = pd.DataFrame(label_desc['categories']).set_index('id').sort_index()
+    attr_df = pd.DataFrame(label_desc['attributes']).set_index('id').sort_index()
+    return cat_df, attr_df
 
 def get_resize_image_info(image_width: int, image_height: int, new_image_size: int):
 
@@ -43,20 +29,7 @@ def get_resize_image_info(image_width: int, image_height: int, new_image_size: i
 
     return new_width, new_height, scale
 
-def generate_coco_annotations(df: pd.DataFrame, image_size: int = None):
-
-    imgs_df = df.groupby(['ImageId'], as_index=False).agg({
-        'Height': 'first',
-        'Width': 'first',
-    })
-    imgs_df.columns = ['ImageId', 'Height', 'Width']
-
-    attributes_map = {attr_id: i for i, attr_id in enumerate(attr_df.index)}
-
-    info = {
-        'num_attributes': len(attributes_map),
-    }
-
+def build_categories(cat_df: pd.DataFrame):
     categories = []
     for category_id, row in cat_df.iterrows():
         categories.append({
@@ -64,12 +37,21 @@ def generate_coco_annotations(df: pd.DataFrame, image_size: int = None):
             'name': row['name'],
             'supercategory': row['supercategory'],
         })
+    return categories
+
+def build_images(df: pd.DataFrame, image_size: int = None):
+    # Image ids follow the sorted ImageId order, so they only depend on the set of images
+    imgs_df = df.groupby(['ImageId'], as_index=False).agg({
+        'Height': 'first',
+        'Width': 'first',
+    })
+    imgs_df.columns = ['ImageId', 'Height', 'Width']
 
     images = []
     image_ids = {}
-    for image_id, row in imgs_df.iterrows():
-        width = row['Width']
-        height = row['Height']
+    for image_id, (image_name, height, width) in enumerate(zip(imgs_df['ImageId'], imgs_df['Height'], imgs_df['Width'])):
+        width = int(width)
+        height = int(height)
         if image_size is not None:
             width, height, _ = get_resize_image_info(width, height, image_size)
 
@@ -77,43 +59,67 @@ def generate_coco_annotations(df: pd.DataFrame, image_size: int = None):
             'id': image_id + 1,
             'width': width,
             'height': height,
-            'file_name': row['ImageId'] + '.jpg',
+            'file_name': image_name + '.jpg',
         })
-        image_ids[row['ImageId']] = image_id + 1
+        image_ids[image_name] = image_id + 1
 
-    annotations = []
-    for i, (annotation_id, row) in tqdm(enumerate(df.iterrows())):
-        mask = get_binary_mask(row['EncodedPixels'], row['Height'], row['Width'])
-        bbox = get_bbox(mask)
+    return images, image_ids
 
-        if image_size is not None:
-            new_width, new_height, scale = get_resize_image_info(row['Width'], row['Height'], image_size)
+def build_annotation(annotation_id, image_id, encoded_pixels, height, width, class_id, attribute_ids,
+                     attributes_map, image_size=None):
+    # bbox and area come straight from the runs; the mask is only built when resizing
+    starts, lengths = rle_tools.parse_encoded_pixels(encoded_pixels)
+    bbox = rle_tools.rle_bbox(starts, lengths, height)
 
-            # resize box
-            bbox = (np.array(bbox, dtype=np.float32) / scale).tolist()
+    if image_size is not None:
+        new_width, new_height, scale = get_resize_image_info(width, height, image_size)
 
-            # resize and encode mask
-            pil_image = Image.fromarray(mask.astype(np.uint8))
-            pil_image = pil_image.resize((new_width, new_height), Image.NEAREST)
-            mask = np.asarray(pil_image)
-            rle = binary_mask_to_rle(mask)
-        else:
-            rle = convert_to_coco_rle([int(p) for p in row['EncodedPixels'].split()], row['Height'], row['Width'])
-
-        annotations.append({
-            'id': annotation_id + 1,
-            'image_id': image_ids[row['ImageId']],
-            'category_id': int(row['ClassId']) + 1,
-            'segmentation': rle,
-            'area': int(mask.sum()),
-            'bbox': bbox,
-            'iscrowd': 0,
-            'attrobute_ids': [attributes_map[int(attr_id)]
-                              for attr_id in row['AttributesIds'].split(',')] if row['AttributesIds'] != '' else [],
-        })
+        # resize box
+        bbox = (np.array(bbox, dtype=np.float32) / scale).tolist()
 
-        if i % 1000 == 0:
-            print(i)
+        # resize and encode mask
+        mask = rle_tools.decode_to_mask(starts, lengths, height, width)
+        pil_image = Image.fromarray(mask)
+        pil_image = pil_image.resize((new_width, new_height), Image.NEAREST)
+        mask = np.asarray(pil_image)
+        rle = rle_tools.binary_mask_to_rle(mask)
+        area = int(mask.sum())
+    else:
+        rle = rle_tools.to_coco_rle(starts, lengths, height, width)
+        area = rle_tools.rle_area(lengths)
+
+    return {
+        'id': int(annotation_id) + 1,
+        'image_id': image_id,
+        'category_id': int(class_id) + 1,
+        'segmentation': rle,
+        'area': area,
+        'bbox': bbox,
+        'iscrowd': 0,
+        'attrobute_ids': [attributes_map[int(attr_id)]
+                          for attr_id in attribute_ids.split(',')] if attribute_ids != '' else [],
+    }
+
+def generate_coco_annotations(df: pd.DataFrame, image_size: int = None, label_desc_path='label_descriptions.json'):
+    df = df.copy()
+    df['AttributesIds'] = df['AttributesIds'].fillna('')
+
+    cat_df, attr_df = load_label_descriptions(label_desc_path)
+    attributes_map = {attr_id: i for i, attr_id in enumerate(attr_df.index)}
+
+    info = {
+        'num_attributes': len(attributes_map),
+    }
+
+    categories = build_categories(cat_df)
+    images, image_ids = build_images(df, image_size)
+
+    annotations = []
+    columns = zip(df.index, df['ImageId'], df['EncodedPixels'], df['Height'], df['Width'],
+                  df['ClassId'], df['AttributesIds'])
+    for annotation_id, image_name, encoded_pixels, height, width, class_id, attribute_ids in tqdm(columns, total=len(df)):
+        annotations.append(build_annotation(annotation_id, image_ids[image_name], encoded_pixels, height, width,
+                                            class_id, attribute_ids, attributes_map, image_size))
 
     return {
         'info': info,
@@ -122,9 +128,97 @@ def generate_coco_annotations(df: pd.DataFrame, image_size: int = None):
         'annotations': annotations,
     }
 
+# Per-worker state for the streaming conversion, set by _init_worker
+_attributes_map = None
+_image_size = None
+
+def _init_worker(attributes_map, image_size):
+    global _attributes_map, _image_size
+    _attributes_map = attributes_map
+    _image_size = image_size
+
+def _convert_rows(rows):
+    # One task is the rows of one image: (annotation_id, image_id, EncodedPixels, Height, Width, ClassId, AttributesIds)
+    return [json_io.dumps(build_annotation(*row, _attributes_map, _image_size)) for row in rows]
+
+def convert_csv_streaming(csv_path, output_json_path, image_size=None, workers=1, chunksize=50000,
+                          label_desc_path='label_descriptions.json'):
+    """Convert an iMaterialist CSV to COCO JSON without holding it in memory.
+
+    A first pass reads only ImageId/Height/Width to assign image ids. The
+    CSV is then read in chunks, its rows grouped by ImageId and each
+    image converted in a process pool. Annotations are written to the
+    output as they come back. Ids depend only on the CSV (sorted ImageId
+    order for images, row number for annotations) and results are written
+    in task order, so the output is the same for any worker count.
+    """
+    cat_df, attr_df = load_label_descriptions(label_desc_path)
+    attributes_map = {attr_id: i for i, attr_id in enumerate(attr_df.index)}
+
+    images, image_ids = build_images(pd.read_csv(csv_path, usecols=['ImageId', 'Height', 'Width']), image_size)
+
+    header = {
+        'info': {'num_attributes': len(attributes_map)},
+        'images': images,
+        'categories': build_categories(cat_df),
+    }
+
+    def image_tasks():
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+            chunk['AttributesIds'] = chunk['AttributesIds'].fillna('')
+            # chunk.index continues across chunks, so it is the global row number
+            rows = zip(chunk.index.tolist(), chunk['ImageId'].map(image_ids).tolist(),
+                       chunk['EncodedPixels'].tolist(), chunk['Height'].tolist(), chunk['Width'].tolist(),
+                       chunk['ClassId'].tolist(), chunk['AttributesIds'].tolist())
+            groups = {}
+            for row in rows:
+                groups.setdefault(row[1], []).append(row)
+            yield from groups.values()
+
+    num_annotations = 0
+    with open(output_json_path, 'w') as f:
+        # Write everything but the annotations, then stream them into the open list
+        f.write(json_io.dumps(header)[:-1])
+        f.write(',"annotations":[')
+
+        if workers <= 1:
+            _init_worker(attributes_map, image_size)
+            results = map(_convert_rows, image_tasks())
+        else:
+            # Bounded, so CSV rows are only read as fast as the writer keeps up
+            results = imap_bounded(_convert_rows, image_tasks(), workers, chunksize=16, ordered=True,
+                                   initializer=_init_worker, initargs=(attributes_map, image_size))
+
+        with tqdm(desc='Annotations', unit='ann') as pbar:
+            for encoded in results:
+                if not encoded:
+                    continue
+                if num_annotations:
+                    f.write(',')
+                f.write(','.join(encoded))
+                num_annotations += len(encoded)
+                pbar.update(len(encoded))
+
+        f.write(']}')
+
+    return num_annotations
+
 if __name__ == "__main__":
 
-    train_annotations = generate_coco_annotations(train_df)
+    parser = argparse.ArgumentParser(description='Convert iMaterialist csv format to COCO json format')
+
+    parser.add_argument('--csv_path', type=str, help='Path to the CSV file')
+    parser.add_argument('--output_json_path', type=str, help='Path to the output COCO JSON file')
+    parser.add_argument('--label_descriptions', type=str, default='label_descriptions.json', help='Path to label_descriptions.json')
+    parser.add_argument('--image_size', type=int, help='Resize images so the longer side has this size (optional)')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes')
+    parser.add_argument('--chunksize', type=int, default=50000, help='Number of CSV rows read at a time')
+
+    args = parser.parse_args()
+
+    # train_df = pd.read_csv('train.csv')
     # with open('train_coco.json', 'w') as f:
-    with open(args.output_json_path, 'w') as f:
-        json.dump(train_annotations, f)
\ No newline at end of file
+    num_annotations = convert_csv_streaming(args.csv_path, args.output_json_path, image_size=args.image_size,
+                                            workers=args.workers, chunksize=args.chunksize,
+                                            label_desc_path=args.label_descriptions)
+    print(f'Wrote {num_annotations} annotations to {args.output_json_path}')
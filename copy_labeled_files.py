@@ -1,9 +1,11 @@
 import os
-import shutil
 import argparse
 from tqdm import tqdm
 
-def copy_files(input_folder, output_folder, label_file):
+import bulk_copy
+from dataset_manifest import open_manifest, stem_of
+
+def copy_files(input_folder, output_folder, label_file, workers=16, mode='auto', overwrite=False):
     # Create the output folder if it doesn't exist
     os.makedirs(output_folder, exist_ok=True)
 
@@ -12,14 +14,31 @@ def copy_files(input_folder, output_folder, label_file):
         filenames = set(line.strip() for line in label_file)
 
     # Iterate through files in the 'labels' folder
+    pairs = []
     for root, _, files in tqdm(os.walk(input_folder), desc="Processing Files"):
         for filename in files:
             file_path = os.path.join(root, filename)
 
             # Check if the filename exists in label.txt
             if filename in filenames:
-                # Copy the file to the output folder
-                shutil.copy(file_path, os.path.join(output_folder, filename))
+                pairs.append((file_path, os.path.join(output_folder, filename)))
+
+    # Copy the matched files to the output folder in parallel
+    return bulk_copy.copy_files(pairs, workers=workers, mode=mode, overwrite=overwrite)
+
+def copy_files_from_manifest(manifest, output_folder, label_file, workers=16, mode='auto', overwrite=False):
+    # The manifest already knows which label files exist, so nothing is walked
+    os.makedirs(output_folder, exist_ok=True)
+
+    with open(label_file, 'r') as label_file:
+        stems = [stem_of(line.strip()) for line in label_file if line.strip()]
+
+    pairs = []
+    for stem, index in zip(stems, manifest.find_many(stems).tolist()):
+        if index >= 0 and manifest.label_size[index] >= 0:
+            pairs.append((manifest.label_path(stem), os.path.join(output_folder, stem + '.txt')))
+
+    return bulk_copy.copy_files(pairs, workers=workers, mode=mode, overwrite=overwrite)
 
 if __name__ == '__main__':
     # Create an argument parser
@@ -29,12 +48,17 @@ if __name__ == '__main__':
     parser.add_argument('--input_folder', type=str, help='Path to the input folder (containing .txt files)')
     parser.add_argument('--output_folder', type=str, help='Path to the output folder (where labeled files will be copied)')
     parser.add_argument('--label_file', type=str, help='Path to the label.txt file containing filenames to match')
+    parser.add_argument('--manifest', type=str, help='Dataset manifest directory (see dataset_manifest.py); replaces --input_folder')
+    parser.add_argument('--workers', type=int, default=16, help='Number of copy threads')
+    parser.add_argument('--mode', choices=bulk_copy.MODES, default='auto',
+                        help='auto: reflink if possible, else in-kernel copy; hardlink: link when on the same file system')
+    parser.add_argument('--overwrite', action='store_true', help='Copy even if the destination has the same size and mtime')
 
     # Parse command-line arguments
     args = parser.parse_args()
 
     # Check if the input folder exists
-    if not os.path.exists(args.input_folder):
+    if not args.manifest and not os.path.exists(args.input_folder):
         print(f"Error: Input folder '{args.input_folder}' does not exist.")
         exit(1)
 
@@ -44,7 +68,12 @@ if __name__ == '__main__':
         exit(1)
 
     # Copy labeled files to the output folder
-    copy_files(args.input_folder, args.output_folder, args.label_file)
+    if args.manifest:
+        stats = copy_files_from_manifest(open_manifest(args.manifest), args.output_folder, args.label_file,
+                                         workers=args.workers, mode=args.mode, overwrite=args.overwrite)
+    else:
+        stats = copy_files(args.input_folder, args.output_folder, args.label_file,
+                           workers=args.workers, mode=args.mode, overwrite=args.overwrite)
 
+    bulk_copy.print_throughput(stats)
     print(f"Labeled files copied to '{args.output_folder}'.")
-
@@ -0,0 +1,281 @@
+import os
+from copy import deepcopy
+from multiprocessing import Pool
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+from pycocotools import mask
+
+import json_io
+import mask_cache
+import polygon_geometry
+from coco_index import CocoIndex
+
+
+def rle2polygon(segmentation):
+    height, width = segmentation['size']
+    m = mask_cache.decode_mask(segmentation, height, width)
+    m[m > 0] = 255
+    contours, _ = cv2.findContours(m, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_TC89_KCOS)
+    polygons = []
+    for contour in contours:
+        epsilon = 0.001 * cv2.arcLength(contour, True)
+        contour_approx = cv2.approxPolyDP(contour, epsilon, True)
+        polygon = contour_approx.flatten().tolist()
+        polygons.append(polygon)
+    return polygons
+
+
+def segmentation_to_rle(segmentation, image_width, image_height):
+    # Uncompressed RLE (list counts) needs frPyObjects, compressed RLE only bytes counts
+    if isinstance(segmentation['counts'], list):
+        return mask.frPyObjects(segmentation, image_height, image_width)
+    counts = segmentation['counts']
+    if isinstance(counts, str):
+        counts = counts.encode('ascii')
+    return {'size': segmentation['size'], 'counts': counts}
+
+
+def compute_crop_box(image_data, annotations, width_scale=1.2, height_scale=1.5):
+    image_width = image_data['width']
+    image_height = image_data['height']
+
+    # Images without annotations are kept whole
+    if not annotations:
+        return 0, 0, image_width, image_height
+
+    # Find the widest and highest points within all bounding boxes
+    min_x = min(annotation['bbox'][0] for annotation in annotations)
+    min_y = min(annotation['bbox'][1] for annotation in annotations)
+    max_x = max(annotation['bbox'][0] + annotation['bbox'][2] for annotation in annotations)
+    max_y = max(annotation['bbox'][1] + annotation['bbox'][3] for annotation in annotations)
+
+    # Calculate new bounding box dimensions
+    new_bbox_x = max(0, min_x)
+    new_bbox_y = max(0, min_y)
+    new_bbox_width = min(image_width, max_x - new_bbox_x)
+    new_bbox_height = min(image_height, max_y - new_bbox_y)
+
+    # Calculate new bounding box coordinates as per requirement
+    new_bbox_width = min(image_width, int(new_bbox_width * width_scale))
+    new_bbox_height = min(image_height, int(new_bbox_height * height_scale))
+
+    # Check for out-of-bounds cropping
+    new_bbox_x = min(new_bbox_x, image_width - new_bbox_width)
+    new_bbox_y = min(new_bbox_y, image_height - new_bbox_height)
+
+    return new_bbox_x, new_bbox_y, new_bbox_width, new_bbox_height
+
+
+def scaled_size(width, height, scale=None):
+    if scale is None:
+        return width, height
+    return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+
+def reproject_annotations(annotations, crop_box, image_width, image_height, scale=None):
+    """Move all annotations of one image into the crop, in place.
+
+    Polygons of every annotation are packed into one array and shifted,
+    clamped to the crop and scaled together; bbox and area are then
+    recomputed from the clamped polygons so they match the crop.
+    Annotations without polygon points keep their bbox, moved the same way.
+    """
+    new_bbox_x, new_bbox_y, new_bbox_width, new_bbox_height = crop_box
+
+    # Convert RLE to polygons if it's RLE encoded
+    for annotation in annotations:
+        if isinstance(annotation['segmentation'], dict):
+            annotation['segmentation'] = rle2polygon(
+                segmentation_to_rle(annotation['segmentation'], image_width, image_height))
+
+    packed = polygon_geometry.pack_polygons([annotation['segmentation'] for annotation in annotations])
+    polygon_geometry.translate(packed, new_bbox_x, new_bbox_y)
+    polygon_geometry.clamp(packed, new_bbox_width, new_bbox_height)
+    if scale is not None:
+        polygon_geometry.scale(packed, scale)
+
+    segmentations = polygon_geometry.unpack_polygons(packed)
+    bboxes = polygon_geometry.annotation_bboxes(packed)
+    areas = polygon_geometry.annotation_areas(packed)
+
+    # Box-only annotations (and RLE that yielded no contour) keep their own
+    # bbox moved into the crop; their area is capped by the clamped box
+    without_points = np.flatnonzero(~polygon_geometry.annotations_with_points(packed))
+    if len(without_points):
+        original = [annotations[index].get('bbox') or [0, 0, 0, 0] for index in without_points.tolist()]
+        moved = polygon_geometry.reproject_bboxes(original, new_bbox_x, new_bbox_y, new_bbox_width, new_bbox_height,
+                                                  scale)
+        bboxes[without_points] = moved
+        box_areas = moved[:, 2] * moved[:, 3]
+        factor = 1.0 if scale is None else scale * scale
+        original_areas = np.array([annotations[index].get('area', np.inf) for index in without_points.tolist()],
+                                  dtype=np.float64) * factor
+        areas[without_points] = np.minimum(original_areas, box_areas)
+
+    for annotation, segmentation, bbox, area in zip(annotations, segmentations, bboxes.tolist(), areas.tolist()):
+        annotation['segmentation'] = segmentation
+        annotation['bbox'] = bbox
+        annotation['area'] = area
+    return annotations
+
+
+def process_image(task):
+    # Works on its own copies, so it is safe to run inside pool workers
+    image_data, annotations, scale = task
+    image_width = image_data['width']
+    image_height = image_data['height']
+
+    crop_box = compute_crop_box(image_data, annotations)
+
+    # Update the image data with new width and height
+    new_image_data = dict(image_data)
+    new_image_data['width'], new_image_data['height'] = scaled_size(crop_box[2], crop_box[3], scale)
+
+    new_annotations = reproject_annotations(deepcopy(annotations), crop_box, image_width, image_height, scale)
+
+    return new_image_data, new_annotations, crop_box
+
+
+# Sidecar in the output image directory: file_name -> parameters its crop was written with
+CROP_PARAMS_FILE = '.crop_params.json'
+
+
+def is_up_to_date(src_path, dst_path):
+    return os.path.exists(dst_path) and os.path.getmtime(dst_path) >= os.path.getmtime(src_path)
+
+
+def crop_params(crop_box, scale=None, quality=95):
+    # Everything besides the source image that changes the written crop
+    return json_io.dumps({'crop_box': [int(round(value)) for value in crop_box], 'scale': scale, 'quality': quality},
+                         sort_keys=True)
+
+
+def load_crop_params(output_image_dir):
+    try:
+        return json_io.load(os.path.join(output_image_dir, CROP_PARAMS_FILE))
+    except (OSError, ValueError):
+        return {}
+
+
+def crop_image_file(src_path, dst_path, crop_box, scale=None, quality=95, overwrite=False):
+    """Crop one image to crop_box (in original pixels), optionally downscaling it.
+
+    With a scale below 1, JPEG decoding goes through Image.draft so the
+    decoder only produces the reduced resolution it needs. Returns False
+    when dst_path is newer than src_path and was left alone; callers that
+    may change crop_box, scale or quality between runs check that
+    themselves and pass overwrite (see write_cropped_images).
+    """
+    if not overwrite and is_up_to_date(src_path, dst_path):
+        return False
+    os.makedirs(os.path.dirname(dst_path) or '.', exist_ok=True)
+
+    crop_x, crop_y, crop_width, crop_height = crop_box
+    out_size = scaled_size(crop_width, crop_height, scale)
+
+    with Image.open(src_path) as img:
+        full_width, full_height = img.size
+        if scale is not None and scale < 1:
+            img.draft(img.mode, (max(1, int(full_width * scale)), max(1, int(full_height * scale))))
+
+        # draft() may have reduced the decoded size, so map the box into it
+        factor_x = img.size[0] / full_width
+        factor_y = img.size[1] / full_height
+        box = (crop_x * factor_x, crop_y * factor_y,
+               (crop_x + crop_width) * factor_x, (crop_y + crop_height) * factor_y)
+        cropped_img = img.crop(tuple(int(round(value)) for value in box))
+
+    if cropped_img.size != out_size:
+        cropped_img = cropped_img.resize(out_size, Image.BILINEAR)
+
+    if os.path.splitext(dst_path)[1].lower() in ('.jpg', '.jpeg'):
+        if cropped_img.mode not in ('RGB', 'L'):
+            cropped_img = cropped_img.convert('RGB')
+        cropped_img.save(dst_path, quality=quality)
+    else:
+        cropped_img.save(dst_path)
+    return True
+
+
+def write_cropped_images(results, image_dir, output_image_dir, scale=None, quality=95,
+                         image_workers=None, overwrite=False):
+    # Decoding and encoding happen in PIL's C code with the GIL released, so threads scale here.
+    # A crop is only skipped when it is newer than its source and was written with the same
+    # box, scale and quality, as recorded in the CROP_PARAMS_FILE sidecar.
+    os.makedirs(output_image_dir, exist_ok=True)
+    recorded = load_crop_params(output_image_dir)
+    current = {}
+
+    def crop_one(result):
+        image_data, _, crop_box = result
+        file_name = image_data['file_name']
+        params = crop_params(crop_box, scale, quality)
+        src_path = os.path.join(image_dir, file_name)
+        dst_path = os.path.join(output_image_dir, file_name)
+        if not overwrite and recorded.get(file_name) == params and is_up_to_date(src_path, dst_path):
+            written = False
+        else:
+            written = crop_image_file(src_path, dst_path, crop_box, scale=scale, quality=quality, overwrite=True)
+        current[file_name] = params
+        return written
+
+    try:
+        with ThreadPoolExecutor(max_workers=image_workers) as executor:
+            written = sum(tqdm(executor.map(crop_one, results), total=len(results), desc='Writing crops'))
+    finally:
+        # Also after a failure, so the crops written so far are not redone
+        json_io.dump(dict(recorded, **current), os.path.join(output_image_dir, CROP_PARAMS_FILE))
+
+    print(f'Wrote {written} cropped images, {len(results) - written} already up to date')
+
+
+def crop_image_groups(image_groups, categories, num_images=None, workers=1, chunksize=None, image_dir=None,
+                      output_image_dir=None, scale=None, quality=95, image_workers=None, overwrite=False,
+                      header=None):
+    """Crop every image to the union of its boxes and re-project its annotations.
+
+    image_groups yields (image_info, annotations) pairs, e.g. from
+    CocoIndex.iter_image_groups or coco_stream.iter_image_groups. Each task
+    carries one image record and only that image's annotations, so pool
+    workers never need the full COCO dict. Results are merged in image id
+    order, making the output independent of the worker count. When
+    image_dir and output_image_dir are given the cropped (and, with scale,
+    downscaled) images are written as well, so they always match the
+    returned JSON. Top-level values of header (info, licenses, ...) are
+    carried through to the result unchanged.
+    """
+    tasks = ((image_data, annotations, scale) for image_data, annotations in image_groups)
+
+    if workers <= 1:
+        results = [process_image(task) for task in tqdm(tasks, total=num_images, desc='Cropping')]
+    else:
+        if chunksize is None:
+            chunksize = max(1, min(64, num_images // (workers * 8))) if num_images else 16
+        with Pool(workers) as pool:
+            results = list(tqdm(pool.imap_unordered(process_image, tasks, chunksize=chunksize),
+                                total=num_images, desc='Cropping'))
+
+    results.sort(key=lambda result: result[0]['id'])
+
+    if image_dir is not None and output_image_dir is not None:
+        write_cropped_images(results, image_dir, output_image_dir, scale=scale, quality=quality,
+                             image_workers=image_workers, overwrite=overwrite)
+
+    new_coco_data = dict(header or {})
+    new_coco_data.update(images=[], annotations=[], categories=categories)
+    for new_image_data, new_annotations, _ in results:
+        new_coco_data['images'].append(new_image_data)
+        new_coco_data['annotations'].extend(new_annotations)
+
+    return new_coco_data
+
+
+def crop_dataset(coco_data, **kwargs):
+    # Same as crop_image_groups for an already loaded COCO dict
+    coco_index = CocoIndex(coco_data)
+    return crop_image_groups(coco_index.iter_image_groups(), coco_data['categories'],
+                             num_images=len(coco_index.images), header=coco_index.header, **kwargs)
@@ -0,0 +1,334 @@
+import os
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+import json_io
+
+MANIFEST_VERSION = 2
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Per-entry arrays, all in sorted stem-hash order
+ARRAYS = ('hashes', 'splits', 'width', 'height', 'image_size', 'image_mtime_ns', 'label_size', 'label_mtime_ns')
+
+
+def stem_of(file_name):
+    return os.path.splitext(os.path.basename(file_name))[0]
+
+
+def stem_hash(stem):
+    return int.from_bytes(hashlib.blake2b(stem.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def stem_hashes(stems):
+    return np.fromiter((stem_hash(stem) for stem in stems), dtype=np.uint64, count=len(stems))
+
+
+def read_split_file(path):
+    # train.txt / val.txt: one label file name per line
+    with open(path, 'r') as f:
+        return [stem_of(line.strip()) for line in f if line.strip()]
+
+
+def scan_directory(directory, extensions):
+    # {stem: (file name, size, mtime_ns)} from one directory listing
+    files = {}
+    if not directory or not os.path.isdir(directory):
+        return files
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.lower().endswith(extensions) and entry.is_file():
+                stat = entry.stat()
+                files[stem_of(entry.name)] = (entry.name, stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def directory_mtime_ns(directory):
+    # Changes whenever a file is added, removed or renamed in directory (not when one is rewritten)
+    try:
+        return os.stat(directory).st_mtime_ns
+    except (OSError, TypeError):
+        return -1
+
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        return None
+
+
+def read_image_size(path):
+    # PIL only parses the header here; pixels are never decoded
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except (OSError, ValueError):
+        return -1, -1
+
+
+class DatasetManifest():
+    """Sorted index of a dataset's images, labels and split membership.
+
+    Entries are sorted by a 64-bit hash of the file stem, so a stem is
+    found with a binary search (O(log n)) and many stems at once with one
+    np.searchsorted call. Per entry it keeps the split membership bits
+    (bit i is split_names[i]), the image dimensions read from the header,
+    and size/mtime of the image and label file (-1 when missing).
+    """
+    def __init__(self, meta, stems, image_names, arrays):
+        self.meta = meta
+        self.stems = stems
+        self.image_names = image_names
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @property
+    def image_dir(self):
+        return self.meta['image_dir']
+
+    @property
+    def label_dir(self):
+        return self.meta['label_dir']
+
+    @property
+    def split_names(self):
+        return list(self.meta['split_files'])
+
+    def is_stale(self):
+        """True when a file was added, removed or renamed in the image or label
+        directory, or a split list changed, since the manifest was built.
+
+        Costs one stat per directory and split list. Files rewritten in
+        place leave directory mtimes alone; refresh(full=True) catches those.
+        """
+        if (directory_mtime_ns(self.image_dir) != self.meta['image_dir_mtime_ns']
+                or directory_mtime_ns(self.label_dir) != self.meta['label_dir_mtime_ns']):
+            return True
+        return any(file_signature(path) != self.meta['split_signatures'].get(split)
+                   for split, path in self.meta['split_files'].items())
+
+    def __len__(self):
+        return len(self.stems)
+
+    def find(self, stem):
+        # Index of stem, or -1; equal hashes are checked against the stored stem
+        target = np.uint64(stem_hash(stem))
+        index = int(np.searchsorted(self.hashes, target))
+        while index < len(self.hashes) and self.hashes[index] == target:
+            if self.stems[index] == stem:
+                return index
+            index += 1
+        return -1
+
+    def __contains__(self, stem):
+        return self.find(stem) >= 0
+
+    def find_many(self, stems):
+        # Vectorized find: one index per stem, -1 when missing
+        stems = list(stems)
+        found = np.full(len(stems), -1, dtype=np.int64)
+        if not len(self.hashes):
+            return found
+        targets = stem_hashes(stems)
+        indices = np.minimum(np.searchsorted(self.hashes, targets), len(self.hashes) - 1)
+        for position in np.flatnonzero(self.hashes[indices] == targets).tolist():
+            index = int(indices[position])
+            found[position] = index if self.stems[index] == stems[position] else self.find(stems[position])
+        return found
+
+    def record(self, stem):
+        index = self.find(stem)
+        if index < 0:
+            return None
+        record = {'stem': stem, 'image_name': self.image_names[index],
+                  'splits': [name for bit, name in enumerate(self.split_names) if self.splits[index] >> bit & 1]}
+        for name in ARRAYS[2:]:
+            record[name] = int(getattr(self, name)[index])
+        return record
+
+    def mask(self, split=None, labeled=None, has_image=None):
+        mask = np.ones(len(self), dtype=bool)
+        if split is not None:
+            mask &= (self.splits >> self.split_names.index(split)) & 1 == 1
+        if labeled is not None:
+            mask &= (self.label_size >= 0) == labeled
+        if has_image is not None:
+            mask &= (self.image_size >= 0) == has_image
+        return mask
+
+    def select(self, split=None, labeled=None, has_image=None):
+        # Stems matching the filters, in manifest order
+        return [self.stems[i] for i in np.flatnonzero(self.mask(split, labeled, has_image)).tolist()]
+
+    def image_path(self, stem):
+        index = self.find(stem)
+        if index < 0 or self.image_names[index] is None:
+            return None
+        return os.path.join(self.image_dir, self.image_names[index])
+
+    def label_path(self, stem):
+        index = self.find(stem)
+        if index < 0 or self.label_size[index] < 0:
+            return None
+        return os.path.join(self.label_dir, stem + '.txt')
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, name + '.npy'), getattr(self, name))
+        # manifest.json is written last, so a manifest without it is incomplete
+        json_io.dump(dict(self.meta, stems=self.stems, image_names=self.image_names),
+                     os.path.join(directory, 'manifest.json'))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        data = json_io.load(os.path.join(directory, 'manifest.json'))
+        if data.get('version') != MANIFEST_VERSION:
+            raise ValueError(f'{directory} was written by another manifest version, rebuild it')
+        stems = data.pop('stems')
+        image_names = data.pop('image_names')
+        mmap_mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode) for name in ARRAYS}
+        return cls(data, stems, image_names, arrays)
+
+    def refresh(self, workers=32, full=False):
+        # Directories whose mtime did not change are not listed again (unless full);
+        # headers are only read for new or changed images
+        return build_manifest(self.image_dir, self.label_dir, self.meta['split_files'], workers=workers,
+                              previous=self, full=full)
+
+    def _files(self, prefix):
+        # {stem: (file name, size, mtime_ns)} as scan_directory would return it, from the stored arrays
+        sizes = getattr(self, prefix + '_size')
+        mtimes = getattr(self, prefix + '_mtime_ns')
+        files = {}
+        for index in np.flatnonzero(sizes >= 0).tolist():
+            stem = self.stems[index]
+            name = self.image_names[index] if prefix == 'image' else stem + '.txt'
+            files[stem] = (name, int(sizes[index]), int(mtimes[index]))
+        return files
+
+
+def build_manifest(image_dir, label_dir, split_files=None, workers=32, previous=None, full=False):
+    """Index image_dir, label_dir and the split lists.
+
+    split_files maps split names to list files, e.g.
+    {'train': 'train.txt', 'val': 'val.txt'}. With previous given, a
+    directory whose mtime is unchanged is not listed again (unless full),
+    and dimensions of images whose size and mtime did not change are
+    taken from it instead of being read again.
+    """
+    split_files = dict(split_files or {})
+    # Taken before listing, so a change during the scan shows up as stale next time
+    image_dir_mtime = directory_mtime_ns(image_dir)
+    label_dir_mtime = directory_mtime_ns(label_dir)
+    split_signatures = {split: file_signature(path) for split, path in split_files.items()}
+
+    def listing(directory, mtime, prefix, extensions):
+        if (previous is not None and not full and mtime >= 0
+                and previous.meta[prefix + '_dir'] == os.path.abspath(directory)
+                and previous.meta[prefix + '_dir_mtime_ns'] == mtime):
+            return previous._files(prefix), False
+        return scan_directory(directory, extensions), True
+
+    images, images_scanned = listing(image_dir, image_dir_mtime, 'image', IMAGE_EXTENSIONS)
+    labels, labels_scanned = listing(label_dir, label_dir_mtime, 'label', ('.txt',))
+
+    split_bits = {}
+    for bit, (split, path) in enumerate(split_files.items()):
+        for stem in read_split_file(path):
+            split_bits[stem] = split_bits.get(stem, 0) | 1 << bit
+
+    stems = sorted(set(images) | set(labels) | set(split_bits), key=lambda stem: (stem_hash(stem), stem))
+    count = len(stems)
+    arrays = {
+        'hashes': stem_hashes(stems),
+        'splits': np.array([split_bits.get(stem, 0) for stem in stems], dtype=np.uint8),
+        'width': np.full(count, -1, dtype=np.int32),
+        'height': np.full(count, -1, dtype=np.int32),
+    }
+    for prefix, files in (('image', images), ('label', labels)):
+        arrays[prefix + '_size'] = np.array([files[stem][1] if stem in files else -1 for stem in stems], dtype=np.int64)
+        arrays[prefix + '_mtime_ns'] = np.array([files[stem][2] if stem in files else -1 for stem in stems], dtype=np.int64)
+    image_names = [images[stem][0] if stem in images else None for stem in stems]
+
+    to_read = []
+    for index, stem in enumerate(stems):
+        if stem not in images:
+            continue
+        if previous is not None:
+            old = previous.find(stem)
+            if (old >= 0 and previous.image_names[old] == image_names[index]
+                    and previous.image_size[old] == arrays['image_size'][index]
+                    and previous.image_mtime_ns[old] == arrays['image_mtime_ns'][index]):
+                arrays['width'][index] = previous.width[old]
+                arrays['height'][index] = previous.height[old]
+                continue
+        to_read.append(index)
+
+    paths = [os.path.join(image_dir, image_names[index]) for index in to_read]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        sizes = list(tqdm(executor.map(read_image_size, paths), total=len(paths), desc='Image headers'))
+    for index, (width, height) in zip(to_read, sizes):
+        arrays['width'][index] = width
+        arrays['height'][index] = height
+
+    meta = {
+        'version': MANIFEST_VERSION,
+        'image_dir': os.path.abspath(image_dir) if image_dir else None,
+        'label_dir': os.path.abspath(label_dir) if label_dir else None,
+        'split_files': {split: os.path.abspath(path) for split, path in split_files.items()},
+        'split_signatures': split_signatures,
+        'image_dir_mtime_ns': image_dir_mtime,
+        'label_dir_mtime_ns': label_dir_mtime,
+        'directories_scanned': int(images_scanned) + int(labels_scanned),
+        'headers_read': len(to_read),
+    }
+    return DatasetManifest(meta, stems, image_names, arrays)
+
+
+def open_manifest(directory, image_dir=None, label_dir=None, split_files=None, workers=32, full=False):
+    """Load the manifest saved in directory, up to date with the file system.
+
+    A saved manifest is used as is while is_stale() is False; otherwise it
+    is refreshed and saved back. When no manifest exists yet it is built
+    from image_dir, label_dir and split_files and saved; without those
+    directories FileNotFoundError is raised.
+    """
+    if os.path.exists(os.path.join(directory, 'manifest.json')):
+        manifest = DatasetManifest.load(directory, mmap=False)
+        if not full and not manifest.is_stale():
+            return manifest
+        manifest = manifest.refresh(workers=workers, full=full)
+    elif image_dir is None and label_dir is None:
+        raise FileNotFoundError(f'No manifest in {directory}; build one with dataset_manifest.py first')
+    else:
+        manifest = build_manifest(image_dir, label_dir, split_files, workers=workers)
+    manifest.save(directory)
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or refresh a dataset manifest of images, labels and splits')
+    parser.add_argument('--manifest', required=True, help='Directory the manifest is stored in')
+    parser.add_argument('--image_dir', help='Directory with the images')
+    parser.add_argument('--label_dir', help='Directory with the YOLO label txt files')
+    parser.add_argument('--train', default='train.txt', help='Train split list (label file names)')
+    parser.add_argument('--val', default='val.txt', help='Validation split list (label file names)')
+    parser.add_argument('--workers', type=int, default=32, help='Threads reading image headers')
+    parser.add_argument('--full', action='store_true', help='Rescan every directory, also catching files rewritten in place')
+    args = parser.parse_args()
+
+    splits = {split: path for split, path in (('train', args.train), ('val', args.val)) if path and os.path.exists(path)}
+    manifest = open_manifest(args.manifest, args.image_dir, args.label_dir, splits, workers=args.workers, full=args.full)
+    print(f"{len(manifest)} entries, {int((manifest.image_size >= 0).sum())} images, "
+          f"{int((manifest.label_size >= 0).sum())} labels, {manifest.meta['directories_scanned']} directories listed, "
+          f"{manifest.meta['headers_read']} image headers read")
+    for split in manifest.split_names:
+        print(f"  {split}: {int(manifest.mask(split).sum())} entries")
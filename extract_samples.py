@@ -1,38 +1,39 @@
+import os
 import argparse
-import json
-import random
-from tqdm import tqdm
 
-def get_random_samples(input_file, num_samples):
-    with open(input_file, 'r') as f:
-        data = json.load(f)
+import coco_cache
+import coco_sampling
+import json_io
 
-    images = data['images']
-    sample_images = random.sample(images, min(num_samples, len(images)))
+def get_random_samples(input_file, num_samples, seed=None, min_per_category=0):
+    # A compiled cache (directory, or an up-to-date one next to the JSON) avoids parsing entirely
+    if os.path.isdir(input_file) or coco_cache.is_cache_valid(input_file):
+        return get_random_samples_from_cache(input_file, num_samples, seed=seed, min_per_category=min_per_category)
 
-    image_ids = {image['id'] for image in sample_images}
-    sample_annotations = [ann for ann in data['annotations'] if ann['image_id'] in image_ids]
+    # Reservoir sampling while streaming, only the sample is kept in memory
+    return coco_sampling.sample_coco_stream(input_file, num_samples, seed=seed, min_per_category=min_per_category)
 
-    sample_data = {
-        'info': data['info'],
-        'licenses': data['licenses'],
-        'images': sample_images,
-        'annotations': sample_annotations
-    }
-
-    return sample_data
+def get_random_samples_from_cache(input_file, num_samples, seed=None, min_per_category=0):
+    cache = coco_cache.open_coco(input_file)
+    return coco_sampling.sample_coco_index(cache, num_samples, seed=seed, min_per_category=min_per_category)
 
 def main():
     parser = argparse.ArgumentParser(description='Extract random samples from COCO person keypoints JSON file')
     parser.add_argument('--input', type=str, required=True, help='Input COCO JSON file path')
     parser.add_argument('--output', type=str, required=True, help='Output JSON file path')
-    parser.add_argument('--num_samples', type=int, default=10, help='Number of samples to extract')
+    parser.add_argument('--num_samples', type=int, default=10,
+                        help='Number of samples to extract; with --min_per_category the subset can be '
+                             'larger, since every image picked for a category is kept')
+    parser.add_argument('--seed', type=int, help='Random seed; the same seed gives the same subset')
+    parser.add_argument('--min_per_category', type=int, default=0,
+                        help='Pick images so every category has at least this many instances in the subset')
+    parser.add_argument('--pretty', action='store_true', help='Indent the output JSON file')
     args = parser.parse_args()
 
-    sample_data = get_random_samples(args.input, args.num_samples)
+    sample_data = get_random_samples(args.input, args.num_samples, seed=args.seed,
+                                     min_per_category=args.min_per_category)
 
-    with open(args.output, 'w') as f:
-        json.dump(sample_data, f, indent=4)
+    json_io.dump(sample_data, args.output, pretty=args.pretty)
 
 if __name__ == '__main__':
     main()
@@ -1,8 +1,11 @@
 import os
+import glob
 import argparse
 import pandas as pd
 from tqdm import tqdm
 
+from dataset_manifest import open_manifest
+
 def get_image_filenames(folder_path):
     image_filenames = []
     for filename in tqdm(os.listdir(folder_path), desc='Image filenames'):
@@ -10,36 +13,75 @@ def get_image_filenames(folder_path):
             image_filenames.append(filename.split('.')[0])
     return image_filenames
 
-# Without progress bar
-# def filter_csv_by_image_ids(csv_path, image_filenames):
-#     df = pd.read_csv(csv_path)
-#     filtered_df = df[df['ImageId'].isin(image_filenames)]
-#     return filtered_df
+def get_image_filenames_from_manifest(manifest_dir):
+    # Same ids as get_image_filenames, without listing the folder
+    # Refreshed first when files were added or removed since it was saved
+    manifest = open_manifest(manifest_dir)
+    return [name.split('.')[0] for name in manifest.image_names if name is not None and name.endswith('.jpg')]
+
+def get_image_filenames_from_glob(pattern):
+    # e.g. 'trainPart/*.jpg'
+    return [os.path.basename(path).split('.')[0] for path in glob.glob(pattern)]
+
+def get_image_ids(source):
+    # A manifest directory, a glob pattern or a plain image folder
+    if os.path.exists(os.path.join(source, 'manifest.json')):
+        return get_image_filenames_from_manifest(source)
+    if glob.has_magic(source):
+        return get_image_filenames_from_glob(source)
+    return get_image_filenames(source)
 
-# with progress bar
 def filter_csv_by_image_ids(csv_path, image_filenames):
-    df = pd.read_csv(csv_path)
-    filtered_rows = []
-    total_rows = len(df)
-    with tqdm(total=total_rows, desc='Filtering CSV') as pbar:
-        for _, row in df.iterrows():
-            if row['ImageId'] in image_filenames:
-                filtered_rows.append(row)
-            pbar.update(1)
-    filtered_df = pd.DataFrame(filtered_rows, columns=df.columns)
-    return filtered_df
+    # Hashed membership over the whole column instead of a per-row list scan
+    df = pd.read_csv(csv_path, dtype={'ImageId': str})
+    return df[df['ImageId'].isin(set(image_filenames))]
+
+def filter_csv_streaming(csv_path, image_filenames, output_csv_path, chunksize=100000, columns=None, id_column='ImageId'):
+    """Write the rows of csv_path whose id_column is in image_filenames to output_csv_path.
+
+    The CSV is read chunksize rows at a time (only id_column and columns,
+    when given) and each chunk's matching rows are appended to the output
+    straight away, so memory is bounded by the chunk size. Returns the
+    number of rows written.
+    """
+    image_ids = pd.Index(pd.unique(pd.Series([str(image_id) for image_id in image_filenames], dtype=object)))
+    usecols = None
+    if columns:
+        usecols = list(dict.fromkeys([id_column] + list(columns)))
+    # Ids stay strings in every chunk; inferred per chunk, all-numeric ones would become ints and never match
+    dtype = {id_column: str}
+
+    written = 0
+    with open(output_csv_path, 'w', newline='') as f, tqdm(desc='Filtering CSV', unit='rows') as pbar:
+        # The header comes from the file itself, so a CSV without data rows still gets one
+        header = pd.read_csv(csv_path, nrows=0, usecols=usecols, dtype=dtype)
+        if usecols:
+            header = header[usecols]
+        header.to_csv(f, index=False)
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize, usecols=usecols, dtype=dtype):
+            if usecols:
+                chunk = chunk[usecols]
+            filtered = chunk[chunk[id_column].isin(image_ids)]
+            filtered.to_csv(f, index=False, header=False)
+            written += len(filtered)
+            pbar.update(len(chunk))
+            pbar.set_postfix(kept=written)
+    return written
 
 def write_filtered_csv(filtered_df, output_csv_path):
     filtered_df.to_csv(output_csv_path, index=False)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Filter a CSV file based on image filenames in a specified folder.')
-    parser.add_argument('folder_path', type=str, help='Path to the folder containing the images')
+    parser.add_argument('folder_path', type=str, help="Folder containing the images, a dataset manifest directory or a glob such as 'trainPart/*.jpg'")
     parser.add_argument('csv_path', type=str, help='Path to the CSV file')
     parser.add_argument('output_csv_path', type=str, help='Path to the output filtered CSV file')
+    parser.add_argument('--chunksize', type=int, default=100000, help='Number of CSV rows read at a time')
+    parser.add_argument('--columns', nargs='+', help='Only keep these columns (ImageId is always kept)')
 
     args = parser.parse_args()
 
-    image_filenames = get_image_filenames(args.folder_path)
-    filtered_df = filter_csv_by_image_ids(args.csv_path, image_filenames)
-    write_filtered_csv(filtered_df, args.output_csv_path)
+    image_filenames = get_image_ids(args.folder_path)
+    written = filter_csv_streaming(args.csv_path, image_filenames, args.output_csv_path,
+                                   chunksize=args.chunksize, columns=args.columns)
+    print(f'Wrote {written} rows to {args.output_csv_path}')
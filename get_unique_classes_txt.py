@@ -1,32 +1,33 @@
+import os
 import glob
 import argparse
-from tqdm import tqdm
 
-def get_unique_classes(label_files):
+import json_io
+from label_stats import scan_labels
 
-    unique_classes = set()
+def get_unique_classes(label_files, workers=32, cache_path=None):
+    # Files are read in parallel; with a cache only new or changed files are read again
+    return set(scan_labels(label_files, workers=workers, cache_path=cache_path)['unique_classes'])
 
-    for file_path in tqdm(label_files, desc="txt files"):
-        with open(file_path, 'r') as file:
-            lines = file.readlines()
-            for line in lines:
-                # extract the class label from the first value of each line
-                class_label = line.split()[0]
-                unique_classes.add(int(class_label))
-
-    return unique_classes
-
-def main(directory_path):
+def main(directory_path, workers=32, cache_path=None, report_path=None):
     # Get a list of all label file paths in the specified directory
-    label_files = glob.glob(directory_path + '*.txt')
+    label_files = glob.glob(os.path.join(directory_path, '*.txt'))
 
-    # Get the unique class labels from the label files
-    unique_classes = get_unique_classes(label_files)
+    # One pass gives the unique classes and the rest of the label statistics
+    stats = scan_labels(label_files, workers=workers, cache_path=cache_path)
 
     # Print the unique class labels
-    for class_label in sorted(unique_classes):
+    for class_label in stats['unique_classes']:
         print(class_label)
 
+    print(f"{len(label_files)} files ({stats['files_read']} read, {stats['files_cached']} cached), "
+          f"{sum(stats['class_instances'].values())} instances, {len(stats['malformed'])} malformed lines")
+    for entry in stats['malformed'][:10]:
+        print(f"  {entry['file']}:{entry['line']}: {entry['reason']}")
+
+    if report_path:
+        json_io.dump(stats, report_path, pretty=True)
+
 
 if __name__ == "__main__":
     # Create an argument parser
@@ -34,9 +35,16 @@ if __name__ == "__main__":
 
     # Add an argument for the directory path
     parser.add_argument("--directory", type=str, help="Path for the txt files")
+    parser.add_argument("--workers", type=int, default=32, help="Threads reading label files")
+    parser.add_argument("--cache", type=str, help="Per-file results cache (default: .label_stats_cache.json in the directory)")
+    parser.add_argument("--no_cache", action="store_true", help="Read every file, do not use or write a cache")
+    parser.add_argument("--report", type=str, help="Write the full statistics (class and per-file instance counts, "
+                                                   "points histogram, malformed lines) to this JSON file")
 
     # Parse the command-line arguments
     args = parser.parse_args()
 
+    cache_path = None if args.no_cache else (args.cache or os.path.join(args.directory, '.label_stats_cache.json'))
+
     # Call the main function with the provided directory path
-    main(args.directory)
\ No newline at end of file
+    main(args.directory, workers=args.workers, cache_path=cache_path, report_path=args.report)
@@ -0,0 +1,37 @@
+# Production serving for predictor.py:
+#   gunicorn -c gunicorn_conf.py predictor:app
+#
+# Each worker is a separate process with its own model instance, warmed up
+# before it accepts requests (/readyz turns 200 once that is done).
+# POSE_WORKERS sets the number of worker processes, POSE_THREADS the request
+# threads per worker (they share the worker's micro-batcher) and
+# POSE_INTRA_OP_THREADS the torch threads per worker. By default the cores are
+# split evenly between workers, so several replicas can share a node without
+# oversubscribing it.
+import os
+import multiprocessing
+
+cpu_count = multiprocessing.cpu_count()
+
+workers = int(os.environ.get("POSE_WORKERS", 1))
+threads = int(os.environ.get("POSE_THREADS", 8))
+worker_class = "gthread"
+bind = os.environ.get("POSE_BIND", "0.0.0.0:5000")
+timeout = int(os.environ.get("POSE_TIMEOUT", 120))
+
+# Workers import predictor themselves, so the model is created after the fork
+preload_app = False
+
+intra_op_threads = int(os.environ.get("POSE_INTRA_OP_THREADS", 0)) or max(1, cpu_count // workers)
+# Set before workers import torch, so OpenMP/MKL pools are sized correctly too
+os.environ["POSE_INTRA_OP_THREADS"] = str(intra_op_threads)
+os.environ.setdefault("OMP_NUM_THREADS", str(intra_op_threads))
+os.environ.setdefault("MKL_NUM_THREADS", str(intra_op_threads))
+
+
+def post_worker_init(worker):
+    # Runs in the worker after the app is loaded and before it accepts connections
+    import predictor
+
+    predictor.warmup()
+    worker.log.info("pose model warmed up with %d intra-op threads", intra_op_threads)
@@ -0,0 +1,58 @@
+import cv2
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def crop_to_coordinates(image, coordinates):
+    """Crop a decoded image to a requested region, clamped to the image.
+
+    coordinates is {"x", "y", "width", "height"}, {"x1", "y1", "x2", "y2"}
+    or a sequence [x1, y1, x2, y2], in pixels.
+    """
+    if isinstance(coordinates, dict):
+        if 'width' in coordinates:
+            x1, y1 = coordinates['x'], coordinates['y']
+            x2, y2 = x1 + coordinates['width'], y1 + coordinates['height']
+        else:
+            x1, y1, x2, y2 = (coordinates[key] for key in ('x1', 'y1', 'x2', 'y2'))
+    elif isinstance(coordinates, (list, tuple)) and len(coordinates) == 4:
+        x1, y1, x2, y2 = coordinates
+    else:
+        raise ValueError(f'Unsupported coordinates: {coordinates!r}')
+
+    height, width = image.shape[:2]
+    x1, x2 = sorted((min(max(int(round(float(x1))), 0), width), min(max(int(round(float(x2))), 0), width)))
+    y1, y2 = sorted((min(max(int(round(float(y1))), 0), height), min(max(int(round(float(y2))), 0), height)))
+    if x2 <= x1 or y2 <= y1:
+        raise ValueError(f'Coordinates {coordinates!r} select no pixels of a {width}x{height} image')
+    # A copy, so the full image can be freed and the crop is contiguous for hashing
+    return np.ascontiguousarray(image[y1:y2, x1:x2])
+
+
+class ImageFetcher():
+    # One pooled HTTP session shared by all request threads, so connections
+    # to the image host are reused instead of opened per request. Every
+    # request shape (URL, URL with coordinates, upload) is decoded by the
+    # same decode(), so they all get the same channel order.
+    def __init__(self, pool_size=32, timeout=10):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def fetch(self, url):
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.content
+
+    @staticmethod
+    def decode(data, coordinates=None):
+        # BGR array, as cv2.imread and the YOLO numpy input expect
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError('Could not decode image')
+        if coordinates is not None:
+            image = crop_to_coordinates(image, coordinates)
+        return image
@@ -0,0 +1,115 @@
+import time
+import queue
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from concurrent.futures import Future
+
+
+class MicroBatcher():
+    """Collects concurrent single-item requests into batched calls.
+
+    submit() queues one input and returns a Future. A background thread
+    takes the first waiting item, keeps collecting until max_batch_size
+    items are queued or max_wait_ms has passed, then calls
+    infer_batch(list_of_inputs), which must return one result per input.
+    An exception fails every request of that batch, and inputs left
+    without a result fail with a RuntimeError. Futures cancelled before
+    their batch starts are skipped.
+    """
+    def __init__(self, infer_batch, max_batch_size=8, max_wait_ms=5):
+        self.infer_batch = infer_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = queue.Queue()
+        self.batch_sizes = deque(maxlen=1000)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Started lazily so the thread is created in the process that serves requests
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._thread.start()
+
+    def submit(self, item):
+        self._ensure_started()
+        future = Future()
+        self.queue.put((item, future))
+        return future
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Requests cancelled while queued (e.g. timed out) are dropped, not inferred
+            batch = [(item, future) for item, future in self._collect() if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            self.batch_sizes.append(len(batch))
+            items = [item for item, _ in batch]
+            try:
+                results = self.infer_batch(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            results = list(results)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            if len(results) != len(batch):
+                # Never leave a request waiting on a result that will not come
+                error = RuntimeError(f'infer_batch returned {len(results)} results for {len(batch)} inputs')
+                for _, future in batch[len(results):]:
+                    future.set_exception(error)
+
+
+class StageMetrics():
+    # Rolling per-stage latency samples (milliseconds), safe to use from many threads
+    def __init__(self, window=1000):
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+        self.counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, stage, milliseconds):
+        with self._lock:
+            self.samples[stage].append(milliseconds)
+            self.counts[stage] += 1
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - start) * 1000.0)
+
+    def summary(self):
+        with self._lock:
+            snapshot = {stage: sorted(samples) for stage, samples in self.samples.items()}
+            counts = dict(self.counts)
+
+        summary = {}
+        for stage, samples in snapshot.items():
+            if not samples:
+                continue
+            summary[stage] = {
+                'count': counts[stage],
+                'mean_ms': sum(samples) / len(samples),
+                'p50_ms': samples[len(samples) // 2],
+                'p95_ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+                'max_ms': samples[-1],
+            }
+        return summary
@@ -0,0 +1,63 @@
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    # NumPy values the stdlib encoder does not know about
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dumps_bytes(obj, pretty=False, sort_keys=False):
+    """Serialize obj to UTF-8 JSON bytes.
+
+    Uses orjson when it is installed (arrays and NumPy scalars are
+    written natively, without tolist()), the stdlib encoder otherwise.
+    Output is compact unless pretty is set, which indents by 2 spaces.
+    """
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=_default, option=option)
+        except TypeError:
+            # Non-contiguous or non-native arrays; the stdlib path below handles them through tolist()
+            pass
+    return dumps(obj, pretty=pretty, sort_keys=sort_keys, _native=False).encode('utf-8')
+
+
+def dumps(obj, pretty=False, sort_keys=False, _native=True):
+    # Same as dumps_bytes, as a str
+    if _native and orjson is not None:
+        return dumps_bytes(obj, pretty=pretty, sort_keys=sort_keys).decode('utf-8')
+    if pretty:
+        return json.dumps(obj, default=_default, indent=2, sort_keys=sort_keys)
+    return json.dumps(obj, default=_default, separators=(',', ':'), sort_keys=sort_keys)
+
+
+def dump(obj, path, pretty=False):
+    with open(path, 'wb') as f:
+        f.write(dumps_bytes(obj, pretty=pretty))
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        return loads(f.read())
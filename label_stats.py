@@ -0,0 +1,131 @@
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from tqdm import tqdm
+
+import json_io
+from yolo_labels import parse_yolo_text
+
+CACHE_VERSION = 3
+
+
+def parse_label_text(text):
+    """Statistics of one YOLO label file's contents.
+
+    Returns a dict with per-class instance counts, a histogram of points
+    per instance and the malformed lines as (line_no, text, reason).
+    Counts are lists of [key, count] pairs, so they survive a JSON round trip.
+    malformed_classes lists the classes of malformed lines whose class id
+    itself is valid, so a class is still reported when only its
+    coordinates are broken.
+    """
+    class_ids, _, offsets, malformed = parse_yolo_text(text)
+    classes, class_counts = np.unique(class_ids, return_counts=True)
+    vertices, vertex_counts = np.unique(np.diff(offsets), return_counts=True)
+    malformed_classes = set()
+    for _, line, _ in malformed:
+        try:
+            malformed_classes.add(int(line.split()[0]))
+        except (ValueError, IndexError):
+            pass
+    return {
+        'classes': list(zip(classes.tolist(), class_counts.tolist())),
+        'vertices': list(zip(vertices.tolist(), vertex_counts.tolist())),
+        'instances': len(class_ids),
+        'malformed': malformed,
+        'malformed_classes': sorted(malformed_classes),
+    }
+
+
+def scan_label_file(path):
+    # One bulk read per file; the open is what costs on network storage
+    with open(path, 'rb') as f:
+        text = f.read().decode('utf-8', errors='replace')
+    return parse_label_text(text)
+
+
+def _scan_with_stat(path):
+    # Size and mtime from the open handle, so reading a file costs no separate stat
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        text = f.read().decode('utf-8', errors='replace')
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'stats': parse_label_text(text)}
+
+
+def load_cache(cache_path):
+    if not cache_path or not os.path.exists(cache_path):
+        return {}
+    try:
+        cache = json_io.load(cache_path)
+    except ValueError:
+        return {}
+    if cache.get('version') != CACHE_VERSION:
+        return {}
+    return cache['files']
+
+
+def save_cache(cache_path, files):
+    # Write then rename, so an interrupted run never leaves a truncated cache
+    tmp_path = cache_path + '.tmp'
+    json_io.dump({'version': CACHE_VERSION, 'files': files}, tmp_path)
+    os.replace(tmp_path, cache_path)
+
+
+def scan_labels(label_files, workers=32, cache_path=None):
+    """Scan YOLO label files with a thread pool and aggregate their statistics.
+
+    With cache_path set, per-file results are stored there keyed by path
+    and reused while the file's size and mtime are unchanged, so re-runs
+    only read new or modified files.
+
+    Returns a dict with unique_classes, class_instances ({class: count}),
+    file_instances ({path: count}), vertex_histogram ({points: count}),
+    malformed (list of {file, line, text, reason}) and the number of files
+    read and taken from the cache.
+    """
+    cached = load_cache(cache_path)
+
+    def scan(path):
+        # Only files with a cache entry are stat'ed; all others are opened and read directly
+        entry = cached.get(path)
+        if entry is not None:
+            stat = os.stat(path)
+            if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                return path, entry, True
+        return path, _scan_with_stat(path), False
+
+    files = {}
+    read = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path, entry, from_cache in tqdm(executor.map(scan, label_files), total=len(label_files), desc="txt files"):
+            files[path] = entry
+            read += not from_cache
+
+    if cache_path and read:
+        save_cache(cache_path, files)
+
+    class_instances = Counter()
+    seen_classes = set()
+    vertex_histogram = Counter()
+    file_instances = {}
+    malformed = []
+    for path in sorted(files):
+        stats = files[path]['stats']
+        class_instances.update(dict(stats['classes']))
+        seen_classes.update(stats['malformed_classes'])
+        vertex_histogram.update(dict(stats['vertices']))
+        file_instances[path] = stats['instances']
+        for line_no, text, reason in stats['malformed']:
+            malformed.append({'file': path, 'line': line_no, 'text': text, 'reason': reason})
+
+    return {
+        'unique_classes': sorted(seen_classes.union(class_instances)),
+        'class_instances': dict(sorted(class_instances.items())),
+        'file_instances': file_instances,
+        'vertex_histogram': dict(sorted(vertex_histogram.items())),
+        'malformed': malformed,
+        'files_read': read,
+        'files_cached': len(files) - read,
+    }
@@ -0,0 +1,312 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from pycocotools import mask as mask_util
+
+import json_io
+
+# The shared cache is off unless one of these is set (or configure() is called).
+# MASK_CACHE_MB is the budget of each process, so a pool of N workers holds up
+# to N times that; configure(workers=N) splits one budget across them instead.
+DEFAULT_MAX_BYTES = int(float(os.environ.get('MASK_CACHE_MB') or 256) * 1024 * 1024)
+DEFAULT_SPILL_DIR = os.environ.get('MASK_CACHE_DIR') or None
+DEFAULT_SPILL_MAX_BYTES = int(float(os.environ.get('MASK_CACHE_DISK_MB') or 4096) * 1024 * 1024)
+ENABLED = bool(os.environ.get('MASK_CACHE_MB') or DEFAULT_SPILL_DIR)
+
+HEADER_SIZE = 13
+
+PACKED = 0
+RLE = 1
+
+
+def decode_segmentation(segmentation, height, width):
+    # Polygons, uncompressed RLE or compressed RLE to a (height, width) uint8 mask
+    if isinstance(segmentation, list):
+        if not segmentation:
+            return np.zeros((height, width), dtype=np.uint8)
+        rle = mask_util.merge(mask_util.frPyObjects(segmentation, height, width))
+    elif isinstance(segmentation['counts'], list):
+        rle = mask_util.frPyObjects(segmentation, height, width)
+    else:
+        rle = segmentation
+    return mask_util.decode(rle)
+
+
+def content_key(segmentation, height, width, namespace=''):
+    # Stable across processes and runs, so it is also safe as a file name on disk
+    if isinstance(segmentation, dict) and isinstance(segmentation.get('counts'), bytes):
+        segmentation = dict(segmentation, counts=segmentation['counts'].decode('ascii'))
+    digest = hashlib.blake2b(json_io.dumps_bytes(segmentation), digest_size=16)
+    digest.update(f'{namespace}:{height}x{width}'.encode('ascii'))
+    return digest.hexdigest()
+
+
+def compress_mask(mask):
+    """Smallest of a bit-packed and a compressed-RLE form of a binary mask.
+
+    Returns (kind, shape, payload bytes); any nonzero pixel counts as set.
+    """
+    binary = np.ascontiguousarray(mask != 0)
+    packed = np.packbits(binary).tobytes()
+    rle = mask_util.encode(np.asfortranarray(binary.astype(np.uint8)))['counts']
+    if len(rle) < len(packed):
+        return RLE, binary.shape, rle
+    return PACKED, binary.shape, packed
+
+
+def expand_mask(kind, shape, payload):
+    # Back to a fresh (writable) uint8 0/1 array
+    if kind == RLE:
+        return mask_util.decode({'size': list(shape), 'counts': payload})
+    count = shape[0] * shape[1]
+    return np.unpackbits(np.frombuffer(payload, dtype=np.uint8), count=count).reshape(shape)
+
+
+class MaskCache():
+    """LRU of decoded binary masks, stored compressed within a byte budget.
+
+    Masks are kept bit-packed or as compressed RLE, whichever is smaller,
+    and unpacked on every get, so callers may modify what they receive.
+    With spill_dir set, every new mask is also written there and misses
+    are looked up on disk before decoding, so a later pass or another
+    process reuses the work. Keys must then be stable strings such as
+    content_key(); annotation ids are only unique within one dataset.
+    The spill directory is kept under spill_max_bytes by deleting the
+    least recently used files; unreadable files count as misses.
+
+    Caching costs a hash and a compression per mask, so it only pays off
+    when masks are decoded more than once.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, spill_dir=None, spill_max_bytes=DEFAULT_SPILL_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.spill_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.spill_evictions = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            self.sweep_spill()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is not None:
+            return expand_mask(*entry)
+
+        entry = self._read_spill(key)
+        if entry is None:
+            return None
+        try:
+            mask = expand_mask(*entry)
+        except Exception:
+            self._remove_spill(key)
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        self._store(key, entry)
+        return mask
+
+    def put(self, key, mask):
+        entry = compress_mask(mask)
+        self._store(key, entry)
+        self._write_spill(key, entry)
+
+    def get_or_decode(self, key, decode):
+        """Cached mask for key, calling decode() to build it on a miss."""
+        mask = self.get(key)
+        if mask is not None:
+            return mask
+        with self._lock:
+            self.misses += 1
+        mask = decode()
+        self.put(key, mask)
+        return mask
+
+    def decode(self, segmentation, height, width, key=None):
+        # Binary mask of a COCO segmentation, keyed by its content unless key is given
+        if key is None:
+            key = content_key(segmentation, height, width)
+        return self.get_or_decode(key, lambda: decode_segmentation(segmentation, height, width))
+
+    def _store(self, key, entry):
+        size = len(entry[2])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous[2])
+            self._entries[key] = entry
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted[2])
+                self.evictions += 1
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, f'{key}.mask')
+
+    def _read_spill(self, key):
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Touched on read, so the sweep drops the least recently used files
+            os.utime(path)
+        except OSError:
+            return None
+        # 13-byte header: kind, then height, width and payload length as little-endian uint32
+        if len(data) < HEADER_SIZE or data[0] not in (PACKED, RLE):
+            self._remove_spill(key)
+            return None
+        height, width, length = (int(value) for value in np.frombuffer(data[1:HEADER_SIZE], dtype='<u4'))
+        payload = data[HEADER_SIZE:]
+        if len(payload) != length or (data[0] == PACKED and length != (height * width + 7) // 8):
+            self._remove_spill(key)
+            return None
+        return data[0], (height, width), payload
+
+    def _remove_spill(self, key):
+        try:
+            os.remove(self._spill_path(key))
+        except OSError:
+            pass
+
+    def _write_spill(self, key, entry):
+        if not self.spill_dir:
+            return
+        kind, shape, payload = entry
+        path = self._spill_path(key)
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(bytes([kind]) + np.array([*shape, len(payload)], dtype='<u4').tobytes() + payload)
+        # Atomic, so concurrent workers never read a partial file
+        os.replace(temp_path, path)
+        with self._lock:
+            self.spill_bytes += HEADER_SIZE + len(payload)
+            over_budget = self.spill_bytes > self.spill_max_bytes
+        if over_budget:
+            self.sweep_spill()
+
+    def sweep_spill(self):
+        """Delete least recently used spill files until the directory is under
+        90% of spill_max_bytes, plus leftover temporary files."""
+        files = []
+        with os.scandir(self.spill_dir) as entries:
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if entry.name.endswith('.tmp'):
+                    # Left behind by a killed writer; live ones are only seconds old
+                    if time.time() - stat.st_mtime > 3600:
+                        self._unlink(entry.path)
+                elif entry.name.endswith('.mask'):
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        if total > self.spill_max_bytes:
+            target = self.spill_max_bytes * 0.9
+            for _, size, path in sorted(files):
+                if total <= target:
+                    break
+                if self._unlink(path):
+                    total -= size
+                    self.spill_evictions += 1
+        with self._lock:
+            self.spill_bytes = total
+
+    @staticmethod
+    def _unlink(path):
+        # Another process may have removed it first
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'spill_bytes': self.spill_bytes,
+            'spill_evictions': self.spill_evictions,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+default_cache = MaskCache(DEFAULT_MAX_BYTES, DEFAULT_SPILL_DIR) if ENABLED else None
+
+
+def configure(max_bytes=None, spill_dir=None, workers=1):
+    """Turn on (or replace) the per-process shared cache.
+
+    max_bytes is the total budget, split evenly across workers processes.
+    The per-process settings are also exported as MASK_CACHE_MB /
+    MASK_CACHE_DIR so that worker processes started afterwards, with any
+    start method, build the same cache.
+    """
+    global default_cache
+    if max_bytes is None:
+        max_bytes = DEFAULT_MAX_BYTES
+    max_bytes = max(1, max_bytes // max(1, workers))
+    os.environ['MASK_CACHE_MB'] = str(max_bytes / (1024 * 1024))
+    if spill_dir:
+        os.environ['MASK_CACHE_DIR'] = spill_dir
+    else:
+        os.environ.pop('MASK_CACHE_DIR', None)
+    default_cache = MaskCache(max_bytes, spill_dir)
+    return default_cache
+
+
+def decode_mask(segmentation, height, width, key=None):
+    # Shared entry point for the bitmask, crop and visualization tools; decodes
+    # directly unless the shared cache is turned on
+    if default_cache is None:
+        return decode_segmentation(segmentation, height, width)
+    return default_cache.decode(segmentation, height, width, key)
+
+
+def print_stats(cache=None):
+    cache = cache or default_cache
+    if cache is None:
+        return
+    stats = cache.stats()
+    print(f"Mask cache: {stats['hits']} hits, {stats['disk_hits']} disk hits, {stats['misses']} misses "
+          f"({stats['hit_rate']:.0%}), {stats['entries']} masks in {stats['bytes'] / (1024 * 1024):.1f} MB, "
+          f"{stats['evictions']} evicted")
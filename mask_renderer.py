@@ -0,0 +1,105 @@
+import os
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+from tqdm import tqdm
+from pycocotools import mask as mask_util
+
+import mask_cache
+from bounded_pool import imap_bounded
+
+
+def convert_segmentation_to_mask(segmentation, width, height, fill=1):
+    if mask_cache.default_cache is None:
+        return rasterize_segmentation(segmentation, width, height, fill)
+    # With the shared mask cache turned on the 0/1 mask comes from it; fill is
+    # applied to the fresh copy it returns (RLE masks stay 0/1, as before)
+    key = mask_cache.content_key(segmentation, height, width, namespace='pil')
+    mask = mask_cache.default_cache.get_or_decode(key, lambda: rasterize_segmentation(segmentation, width, height))
+    if fill != 1 and isinstance(segmentation, list):
+        mask *= np.uint8(fill)
+    return mask
+
+
+def rasterize_segmentation(segmentation, width, height, fill=1):
+    mask = Image.new('L', (width, height), 0)
+    draw = ImageDraw.Draw(mask)
+
+    if isinstance(segmentation, list):
+        for segment in segmentation:
+            draw.polygon(segment, outline=fill, fill=fill)
+
+    elif isinstance(segmentation, dict) and 'counts' in segmentation and 'size' in segmentation:
+        rle = mask_util.frPyObjects(segmentation, height, width)
+        mask = mask_util.decode(rle)
+
+    return np.array(mask)
+
+
+def render_combined_mask(image_info, annotations, use_category_id=False):
+    image_width = image_info['width']
+    image_height = image_info['height']
+
+    combined_mask = np.zeros((image_height, image_width), dtype=np.uint8)
+    for annotation in annotations:
+        fill = annotation['category_id'] if use_category_id else 1
+        mask = convert_segmentation_to_mask(annotation['segmentation'], image_width, image_height, fill)
+        # In-place maximum avoids allocating a new full-size array per annotation
+        np.maximum(combined_mask, mask, out=combined_mask)
+    return combined_mask
+
+
+def mask_path_for(image_info, output_dir):
+    mask_file_name = os.path.splitext(image_info['file_name'])[0] + '_combined_mask.png'
+    return os.path.join(output_dir, mask_file_name)
+
+
+def _render_and_save(task):
+    # Runs inside the worker: only this image's record and annotations are pickled
+    image_info, annotations, output_dir, use_category_id = task
+    combined_mask = render_combined_mask(image_info, annotations, use_category_id)
+    mask_path = mask_path_for(image_info, output_dir)
+    Image.fromarray(combined_mask).save(mask_path)
+    return os.path.getsize(mask_path)
+
+
+def render_masks(image_groups, output_dir, workers=1, use_category_id=False, chunksize=4, total=None):
+    """Render one combined mask PNG per (image_info, annotations) pair.
+
+    Serial and pooled runs go through the same render/save code, so the
+    written files are identical. In pooled mode the number of tasks in
+    flight is capped, keeping memory flat however many images are fed in.
+    Returns a dict with images, bytes, seconds, images_per_s and mb_per_s.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = ((image_info, annotations, output_dir, use_category_id)
+             for image_info, annotations in image_groups)
+
+    num_images = 0
+    num_bytes = 0
+    start = time.perf_counter()
+
+    if workers <= 1:
+        for task in tqdm(tasks, total=total, desc='Rendering masks'):
+            num_bytes += _render_and_save(task)
+            num_images += 1
+    else:
+        results = imap_bounded(_render_and_save, tasks, workers, chunksize=chunksize)
+        for size in tqdm(results, total=total, desc='Rendering masks'):
+            num_bytes += size
+            num_images += 1
+
+    seconds = time.perf_counter() - start
+    return {
+        'images': num_images,
+        'bytes': num_bytes,
+        'seconds': seconds,
+        'images_per_s': num_images / seconds if seconds else 0.0,
+        'mb_per_s': num_bytes / (1024 * 1024) / seconds if seconds else 0.0,
+    }
+
+
+def print_throughput(stats):
+    print(f"Wrote {stats['images']} masks ({stats['bytes'] / (1024 * 1024):.1f} MB) in {stats['seconds']:.1f}s: "
+          f"{stats['images_per_s']:.1f} images/s, {stats['mb_per_s']:.2f} MB/s")
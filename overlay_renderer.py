@@ -0,0 +1,357 @@
+import os
+import time
+import colorsys
+import argparse
+from multiprocessing import cpu_count
+
+import cv2
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+import mask_cache
+from bounded_pool import imap_bounded
+from pose_postprocess import default_skeleton
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+def build_palette(size=64):
+    # Distinct, saturated RGB colors: hues spread by the golden ratio
+    colors = [colorsys.hsv_to_rgb((i * 0.618033988749895) % 1.0, 0.85, 0.95) for i in range(size)]
+    return np.array([[int(c * 255) for c in color] for color in colors], dtype=np.uint8)
+
+
+# Built once per process; drawing only indexes into it
+PALETTE = build_palette()
+PALETTE_TUPLES = [tuple(int(c) for c in color) for color in PALETTE]
+
+DEFAULT_OPTIONS = {
+    'max_size': None,  # longest side of the written overlay, None keeps the image size
+    'alpha': 0.45,  # mask fill opacity
+    'show_masks': True,
+    'show_outlines': True,
+    'show_boxes': True,
+    'show_labels': True,
+    'show_keypoints': True,
+    'category_names': {},
+    'quality': 90,
+}
+
+
+def color_for(category_id):
+    return PALETTE_TUPLES[int(category_id) % len(PALETTE_TUPLES)]
+
+
+def load_image(path, max_size=None):
+    """Decode an image to an RGB array, at most max_size on its longest side.
+
+    JPEGs are decoded through Image.draft, so a thumbnail never pays for a
+    full-resolution decode. Returns (array, scale, (width, height)) where
+    scale maps original pixel coordinates into the array.
+    """
+    with Image.open(path) as img:
+        width, height = img.size
+        if max_size and max(width, height) > max_size:
+            factor = max_size / max(width, height)
+            target = (max(1, int(width * factor)), max(1, int(height * factor)))
+            img.draft('RGB', target)
+            img = img.convert('RGB').resize(target, Image.BILINEAR)
+        else:
+            img = img.convert('RGB')
+        array = np.array(img)
+    return array, array.shape[1] / width, (width, height)
+
+
+def annotation_polygons(segmentation):
+    # COCO polygon segmentation as (n, 2) float arrays; RLE gives []
+    if not isinstance(segmentation, list):
+        return []
+    return [np.asarray(polygon, dtype=np.float64).reshape(-1, 2) for polygon in segmentation if len(polygon) >= 6]
+
+
+def annotation_box(annotation, polygons):
+    if annotation.get('bbox'):
+        x, y, w, h = annotation['bbox']
+        return x, y, x + w, y + h
+    if polygons:
+        points = np.concatenate(polygons)
+        return (*points.min(axis=0), *points.max(axis=0))
+    return None
+
+
+def draw_annotations(image, annotations, scale, size, options):
+    """Draw annotations in place onto an RGB array.
+
+    annotations are COCO-style dicts (category_id, bbox, segmentation as
+    polygons or RLE, keypoints) in original pixel coordinates; scale maps
+    them onto image. All mask fills go to one layer blended once per image.
+    """
+    width, height = size
+    fill_layer = image.copy() if options['show_masks'] else None
+    filled = False
+    outlines = []
+    labels = []
+
+    for annotation in annotations:
+        color = color_for(annotation.get('category_id', 0))
+        segmentation = annotation.get('segmentation')
+        polygons = annotation_polygons(segmentation)
+        scaled = [np.round(polygon * scale).astype(np.int32) for polygon in polygons]
+
+        if fill_layer is not None:
+            if scaled:
+                cv2.fillPoly(fill_layer, scaled, color)
+                filled = True
+            elif isinstance(segmentation, dict) and 'counts' in segmentation:
+                mask = mask_cache.decode_mask(segmentation, height, width)
+                if mask.shape[:2] != image.shape[:2]:
+                    mask = cv2.resize(mask, (image.shape[1], image.shape[0]), interpolation=cv2.INTER_NEAREST)
+                fill_layer[mask.astype(bool)] = color
+                filled = True
+
+        if options['show_outlines'] and scaled:
+            outlines.append((scaled, color))
+
+        box = annotation_box(annotation, polygons)
+        if box is not None and (options['show_boxes'] or options['show_labels']):
+            x0, y0, x1, y1 = (int(round(value * scale)) for value in box)
+            labels.append((x0, y0, x1, y1, color, annotation.get('category_id', 0)))
+
+    if filled:
+        cv2.addWeighted(fill_layer, options['alpha'], image, 1 - options['alpha'], 0, dst=image)
+
+    for polygons, color in outlines:
+        cv2.polylines(image, polygons, True, color, 1, cv2.LINE_AA)
+
+    font_scale = max(0.35, min(image.shape[:2]) / 1000)
+    for x0, y0, x1, y1, color, category_id in labels:
+        if options['show_boxes']:
+            cv2.rectangle(image, (x0, y0), (x1, y1), color, 2 if font_scale > 0.5 else 1)
+        if options['show_labels']:
+            text = str(options['category_names'].get(category_id, category_id))
+            cv2.putText(image, text, (x0, max(y0 - 4, 10)), FONT, font_scale, color, 1, cv2.LINE_AA)
+
+    if options['show_keypoints']:
+        draw_keypoints(image, annotations, scale)
+    return image
+
+
+def draw_keypoints(image, annotations, scale):
+    # COCO 17-keypoint skeleton edges, as used by the pose postprocessing
+    radius = max(2, int(min(image.shape[:2]) / 250))
+    for annotation in annotations:
+        keypoints = annotation.get('keypoints')
+        if not keypoints:
+            continue
+        keypoints = np.asarray(keypoints, dtype=np.float64).reshape(-1, 3)
+        points = np.round(keypoints[:, :2] * scale).astype(np.int32)
+        visible = keypoints[:, 2] > 0
+        color = color_for(annotation.get('category_id', 0))
+        for a, b in zip(default_skeleton.edge_a.tolist(), default_skeleton.edge_b.tolist()):
+            if a < len(points) and b < len(points) and visible[a] and visible[b]:
+                cv2.line(image, tuple(points[a]), tuple(points[b]), color, 2, cv2.LINE_AA)
+        for point in points[visible]:
+            cv2.circle(image, tuple(point), radius, (255, 255, 255), -1, cv2.LINE_AA)
+
+
+def yolo_to_annotations(class_ids, polygons, width, height):
+    # Normalized YOLO polygons to COCO-style pixel annotations
+    return [{'category_id': int(class_id), 'segmentation': [(polygon * (width, height)).ravel().tolist()]}
+            for class_id, polygon in zip(class_ids, polygons)]
+
+
+def render_overlay(image_path, annotations, options, normalized=False):
+    """RGB array of image_path with its annotations drawn on it.
+
+    With normalized set, annotations are (class_ids, polygons) in YOLO
+    normalized coordinates, converted once the image size is known.
+    """
+    image, scale, size = load_image(image_path, options['max_size'])
+    if normalized:
+        annotations = yolo_to_annotations(*annotations, *size)
+    return draw_annotations(image, annotations, scale, size, options)
+
+
+def save_jpeg(image, path, quality):
+    Image.fromarray(image).save(path, quality=quality)
+    return os.path.getsize(path)
+
+
+def _render_overlay_task(task):
+    image_path, annotations, normalized, output_path, options = task
+    try:
+        image = render_overlay(image_path, annotations, options, normalized)
+    except (OSError, ValueError):
+        return 0, 1
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    return save_jpeg(image, output_path, options['quality']), 0
+
+
+def _render_sheet_task(task):
+    # One contact sheet: a grid of thumbnails, each captioned with its file name
+    entries, normalized, output_path, options, columns, thumb_size = task
+    rows = (len(entries) + columns - 1) // columns
+    caption = 14
+    sheet = np.full((rows * (thumb_size + caption), columns * thumb_size, 3), 32, dtype=np.uint8)
+    failed = 0
+    for position, (image_path, annotations) in enumerate(entries):
+        try:
+            thumb = render_overlay(image_path, annotations, dict(options, max_size=thumb_size), normalized)
+        except (OSError, ValueError):
+            failed += 1
+            continue
+        top = (position // columns) * (thumb_size + caption)
+        left = (position % columns) * thumb_size
+        sheet[top:top + thumb.shape[0], left:left + thumb.shape[1]] = thumb
+        name = os.path.basename(image_path)[:thumb_size // 7]
+        cv2.putText(sheet, name, (left + 2, top + thumb_size + caption - 3), FONT, 0.35, (230, 230, 230), 1, cv2.LINE_AA)
+    return save_jpeg(sheet, output_path, options['quality']), failed
+
+
+def iter_coco_entries(image_groups, image_dir):
+    for image_info, annotations in image_groups:
+        yield os.path.join(image_dir, image_info['file_name']), annotations
+
+
+def iter_yolo_entries(labels, image_dir, image_ext='.jpg'):
+    # labels is a yolo_labels.YoloLabelSet; entries carry normalized polygons
+    for index, name in enumerate(labels.names):
+        stem = os.path.splitext(name)[0]
+        yield os.path.join(image_dir, stem + image_ext), (labels.classes(index).tolist(), labels.polygons(index))
+
+
+def overlay_path(image_path, output_dir, image_dir=None):
+    # Mirrors the image's path below image_dir, so images in different
+    # subdirectories that share a stem do not overwrite each other
+    relative = os.path.relpath(image_path, image_dir) if image_dir else os.path.basename(image_path)
+    if relative.startswith(os.pardir + os.sep) or os.path.isabs(relative):
+        relative = os.path.basename(image_path)
+    return os.path.join(output_dir, os.path.splitext(relative)[0] + '_overlay.jpg')
+
+
+def _chunks(entries, size):
+    chunk = []
+    for entry in entries:
+        chunk.append(entry)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def render_dataset(entries, output_dir, normalized=False, contact_sheet=None, thumb_size=256, workers=1,
+                   chunksize=4, total=None, limit=None, image_dir=None, **options):
+    """Render (image_path, annotations) entries to overlay JPEGs or contact sheets.
+
+    With contact_sheet=(columns, rows), every columns * rows images become
+    one sheet_00000.jpg of thumb_size thumbnails; otherwise one
+    <stem>_overlay.jpg is written per image, in the subdirectory the image
+    has below image_dir (directly in output_dir without image_dir). Images are decoded, drawn and
+    encoded inside a process pool. Returns a stats dict like
+    mask_renderer.render_masks.
+    """
+    options = dict(DEFAULT_OPTIONS, **options)
+    os.makedirs(output_dir, exist_ok=True)
+    if limit is not None:
+        entries = (entry for index, entry in zip(range(limit), entries))
+        total = min(total, limit) if total is not None else limit
+
+    if contact_sheet:
+        columns, rows = contact_sheet
+        per_sheet = columns * rows
+        tasks = ((chunk, normalized, os.path.join(output_dir, f'sheet_{index:05d}.jpg'), options, columns, thumb_size)
+                 for index, chunk in enumerate(_chunks(entries, per_sheet)))
+        function = _render_sheet_task
+        total = (total + per_sheet - 1) // per_sheet if total is not None else None
+        desc = 'Rendering sheets'
+    else:
+        tasks = ((image_path, annotations, normalized,
+                  overlay_path(image_path, output_dir, image_dir), options)
+                 for image_path, annotations in entries)
+        function = _render_overlay_task
+        desc = 'Rendering overlays'
+
+    results = map(function, tasks) if workers <= 1 else imap_bounded(function, tasks, workers, chunksize=chunksize)
+    num_files = num_bytes = failed = 0
+    start = time.perf_counter()
+    for size, task_failed in tqdm(results, total=total, desc=desc):
+        num_files += 1
+        num_bytes += size
+        failed += task_failed
+    seconds = time.perf_counter() - start
+
+    return {
+        'files': num_files,
+        'failed': failed,
+        'bytes': num_bytes,
+        'seconds': seconds,
+        'files_per_s': num_files / seconds if seconds else 0.0,
+        'mb_per_s': num_bytes / (1024 * 1024) / seconds if seconds else 0.0,
+    }
+
+
+def print_throughput(stats):
+    print(f"Wrote {stats['files']} files ({stats['bytes'] / (1024 * 1024):.1f} MB) in {stats['seconds']:.1f}s: "
+          f"{stats['files_per_s']:.1f} files/s, {stats['mb_per_s']:.2f} MB/s, {stats['failed']} images failed")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render annotation overlays or contact sheets for a COCO or YOLO dataset')
+    parser.add_argument('--format', choices=('coco', 'yolo'), default='coco', help='Annotation format')
+    parser.add_argument('--annotations', help='COCO JSON file or compiled cache directory (coco)')
+    parser.add_argument('--stream', action='store_true', help='Stream the COCO JSON instead of loading it (coco)')
+    parser.add_argument('--label_dir', help='Directory with the YOLO label txt files (yolo)')
+    parser.add_argument('--list', help='Split list such as train.txt or val.txt; default: every txt in --label_dir (yolo)')
+    parser.add_argument('--image_ext', default='.jpg', help='Image file extension (yolo)')
+    parser.add_argument('--image_dir', required=True, help='Directory with the images')
+    parser.add_argument('--output_dir', required=True, help='Directory to write the overlays or sheets to')
+    parser.add_argument('--contact_sheet', help='Write contact sheets of COLUMNSxROWS thumbnails, e.g. 6x6')
+    parser.add_argument('--thumb_size', type=int, default=256, help='Thumbnail size in contact sheets')
+    parser.add_argument('--max_size', type=int, help='Longest side of single overlays (default: image size)')
+    parser.add_argument('--limit', type=int, help='Only render the first N images')
+    parser.add_argument('--no_masks', action='store_true', help='Do not fill masks')
+    parser.add_argument('--no_boxes', action='store_true', help='Do not draw boxes')
+    parser.add_argument('--no_labels', action='store_true', help='Do not write class labels')
+    parser.add_argument('--workers', type=int, default=cpu_count(), help='Number of worker processes')
+    parser.add_argument('--chunksize', type=int, default=4, help='Images (or sheets) per task sent to a worker')
+    args = parser.parse_args()
+
+    if args.format == 'coco':
+        if args.stream:
+            import coco_stream
+
+            images = list(coco_stream.iter_images(args.annotations))
+            categories = list(coco_stream.iter_categories(args.annotations))
+            image_groups = coco_stream.iter_image_groups(args.annotations, images=images)
+        else:
+            from coco_cache import open_coco
+
+            coco = open_coco(args.annotations)
+            images = coco.images
+            categories = coco.categories
+            image_groups = coco.iter_image_groups()
+        entries = iter_coco_entries(image_groups, args.image_dir)
+        total = len(images)
+        category_names = {category['id']: category['name'] for category in categories}
+        normalized = False
+    else:
+        from yolo_labels import YoloLabelSet, load_split
+
+        if args.list:
+            labels = load_split(args.list, args.label_dir)
+        else:
+            names = sorted(name for name in os.listdir(args.label_dir) if name.endswith('.txt'))
+            labels = YoloLabelSet.from_files([os.path.join(args.label_dir, name) for name in names], names=names)
+        entries = iter_yolo_entries(labels, args.image_dir, args.image_ext)
+        total = len(labels)
+        category_names = {}
+        normalized = True
+
+    contact_sheet = tuple(int(value) for value in args.contact_sheet.lower().split('x')) if args.contact_sheet else None
+    stats = render_dataset(entries, args.output_dir, normalized=normalized, contact_sheet=contact_sheet,
+                           thumb_size=args.thumb_size, workers=args.workers, chunksize=args.chunksize, total=total,
+                           limit=args.limit, image_dir=args.image_dir, max_size=args.max_size, category_names=category_names,
+                           show_masks=not args.no_masks, show_boxes=not args.no_boxes, show_labels=not args.no_labels)
+    print_throughput(stats)
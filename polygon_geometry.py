@@ -0,0 +1,107 @@
+import numpy as np
+
+
+class PackedPolygons():
+    # All polygons of a group of annotations in one (N, 2) point array.
+    # Polygon p spans points[starts[p]:starts[p] + lengths[p]] and belongs to annotation owners[p].
+    def __init__(self, points, starts, lengths, owners, num_annotations):
+        self.points = points
+        self.starts = starts
+        self.lengths = lengths
+        self.owners = owners
+        self.num_annotations = num_annotations
+
+
+def pack_polygons(segmentations):
+    # segmentations: one list of flat [x0, y0, x1, y1, ...] polygons per annotation
+    flat = []
+    lengths = []
+    owners = []
+    for owner, polygons in enumerate(segmentations):
+        for polygon in polygons:
+            num_points = len(polygon) // 2
+            if num_points == 0:
+                continue
+            flat.extend(polygon[:num_points * 2])
+            lengths.append(num_points)
+            owners.append(owner)
+
+    points = np.asarray(flat, dtype=np.float64).reshape(-1, 2)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    starts = np.zeros(len(lengths), dtype=np.int64)
+    if len(lengths):
+        np.cumsum(lengths[:-1], out=starts[1:])
+    return PackedPolygons(points, starts, lengths, np.asarray(owners, dtype=np.int64), len(segmentations))
+
+
+def unpack_polygons(packed):
+    segmentations = [[] for _ in range(packed.num_annotations)]
+    flat = packed.points.ravel().tolist()
+    for start, length, owner in zip(packed.starts.tolist(), packed.lengths.tolist(), packed.owners.tolist()):
+        segmentations[owner].append(flat[start * 2:(start + length) * 2])
+    return segmentations
+
+
+def translate(packed, dx, dy):
+    packed.points -= (dx, dy)
+    return packed
+
+
+def clamp(packed, width, height):
+    np.clip(packed.points[:, 0], 0, width, out=packed.points[:, 0])
+    np.clip(packed.points[:, 1], 0, height, out=packed.points[:, 1])
+    return packed
+
+
+def scale(packed, factor_x, factor_y=None):
+    packed.points *= (factor_x, factor_x if factor_y is None else factor_y)
+    return packed
+
+
+def polygon_areas(packed):
+    # Shoelace formula over every polygon at once
+    if not len(packed.lengths):
+        return np.zeros(0, dtype=np.float64)
+    x = packed.points[:, 0]
+    y = packed.points[:, 1]
+    following = np.arange(1, len(x) + 1)
+    following[packed.starts + packed.lengths - 1] = packed.starts
+    cross = x * y[following] - x[following] * y
+    return 0.5 * np.abs(np.add.reduceat(cross, packed.starts))
+
+
+def annotation_areas(packed):
+    return np.bincount(packed.owners, weights=polygon_areas(packed), minlength=packed.num_annotations)
+
+
+def annotations_with_points(packed):
+    # True for every annotation that owns at least one polygon point
+    return np.bincount(packed.owners, minlength=packed.num_annotations) > 0
+
+
+def reproject_bboxes(bboxes, dx, dy, width, height, factor=None):
+    """COCO [x, y, width, height] boxes shifted by (dx, dy), clamped to a
+    width x height region and scaled, like translate/clamp/scale do for points."""
+    boxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    corners = np.concatenate([boxes[:, 0:2], boxes[:, 0:2] + boxes[:, 2:4]], axis=1) - (dx, dy, dx, dy)
+    np.clip(corners[:, 0::2], 0, width, out=corners[:, 0::2])
+    np.clip(corners[:, 1::2], 0, height, out=corners[:, 1::2])
+    if factor is not None:
+        corners *= factor
+    return np.concatenate([corners[:, 0:2], corners[:, 2:4] - corners[:, 0:2]], axis=1)
+
+
+def annotation_bboxes(packed):
+    # COCO [x, y, width, height] per annotation; annotations without points get zeros
+    bboxes = np.zeros((packed.num_annotations, 4), dtype=np.float64)
+    if not len(packed.lengths):
+        return bboxes
+
+    # Polygons are packed in annotation order, so each annotation's points are contiguous
+    owners, first_polygon = np.unique(packed.owners, return_index=True)
+    point_starts = packed.starts[first_polygon]
+    mins = np.minimum.reduceat(packed.points, point_starts, axis=0)
+    maxs = np.maximum.reduceat(packed.points, point_starts, axis=0)
+    bboxes[owners, 0:2] = mins
+    bboxes[owners, 2:4] = maxs - mins
+    return bboxes
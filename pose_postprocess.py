@@ -0,0 +1,89 @@
+import os
+import uuid
+
+import numpy as np
+
+# COCO 17-keypoint skeleton grouped into line classes; keypoint indices are 1-based
+body_connections = [
+    {"box": [[1, 2], [2, 3], [3, 5], [5, 7]], "class": 0},
+    {"box": [[1, 3]], "class": 0},
+    {"box": [[2, 4], [4, 6]], "class": 0},
+    {"box": [[6, 7], [7, 9]], "class": 1},
+    {"box": [[6, 8], [8, 10]], "class": 1},
+    {"box": [[9, 11]], "class": 1},
+    {"box": [[16, 14], [14, 12]], "class": 2},
+    {"box": [[17, 15], [15, 13]], "class": 2},
+    {"box": [[6, 12], [12, 13]], "class": 3},
+    {"box": [[7, 13]], "class": 3},
+]
+
+
+class Skeleton():
+    # body_connections flattened once into edge index arrays.
+    # Edges are stored group by group, group g owning edges group_starts[g]:group_starts[g + 1].
+    def __init__(self, connections):
+        edges = [edge for connection in connections for edge in connection["box"]]
+        self.edge_a = np.array([edge[0] - 1 for edge in edges], dtype=np.int64)
+        self.edge_b = np.array([edge[1] - 1 for edge in edges], dtype=np.int64)
+        self.group_classes = [connection["class"] for connection in connections]
+        group_sizes = [len(connection["box"]) for connection in connections]
+        self.group_starts = np.zeros(len(connections) + 1, dtype=np.int64)
+        np.cumsum(group_sizes, out=self.group_starts[1:])
+
+
+default_skeleton = Skeleton(body_connections)
+
+
+def _uuid4_strings(count):
+    # One urandom call for all ids instead of uuid.uuid4() per segment
+    data = os.urandom(16 * count)
+    return [str(uuid.UUID(bytes=data[i * 16:(i + 1) * 16], version=4)) for i in range(count)]
+
+
+def postprocess_pose_keypoints(keypoints, skeleton=default_skeleton):
+    """Turn per-person keypoints into "lines" boxes, one per visible skeleton group.
+
+    keypoints is an (N, K, 3) array of x, y, visibility (as returned by
+    YOLO) or a list of flat COCO [x1, y1, v1, x2, ...] lists. An edge is
+    drawn when both of its keypoints have visibility > 0.5; visibility
+    and rounding are computed for all people and edges at once.
+    """
+    keypoints = np.asarray(keypoints, dtype=np.float64)
+    if keypoints.size == 0:
+        return []
+    keypoints = keypoints.reshape(len(keypoints), -1, 3)
+
+    visible = keypoints[:, :, 2] > 0.5
+    edge_visible = visible[:, skeleton.edge_a] & visible[:, skeleton.edge_b]
+    # np.rint rounds half to even, like round()
+    points = np.rint(keypoints[:, :, :2]).astype(np.int64)
+    starts = points[:, skeleton.edge_a].tolist()
+    ends = points[:, skeleton.edge_b].tolist()
+
+    group_starts = skeleton.group_starts.tolist()
+    group_visible = np.logical_or.reduceat(edge_visible, skeleton.group_starts[:-1], axis=1)
+    pks = iter(_uuid4_strings(int(group_visible.sum())))
+    edge_visible = edge_visible.tolist()
+
+    result = []
+    for person, person_groups in enumerate(group_visible.tolist()):
+        person_visible = edge_visible[person]
+        person_starts = starts[person]
+        person_ends = ends[person]
+        for group, any_visible in enumerate(person_groups):
+            if not any_visible:
+                continue
+            group_line = []
+            for edge in range(group_starts[group], group_starts[group + 1]):
+                if person_visible[edge]:
+                    group_line.append(person_starts[edge])
+                    group_line.append(person_ends[edge])
+            result.append(
+                {
+                    "box": group_line,
+                    "pk": next(pks),
+                    "class": skeleton.group_classes[group],
+                    "boxtype": "lines",
+                }
+            )
+    return result
@@ -1,105 +1,127 @@
-import json
-import uuid
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 import numpy as np
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from ultralytics import YOLO
-from utils import download_image_from_url
+import json_io
+from image_fetcher import ImageFetcher
+from inference_batcher import MicroBatcher, StageMetrics
+from pose_postprocess import postprocess_pose_keypoints
+from response_cache import ResponseCache, make_key
 
 
-class CustomEncoder(DefaultJSONProvider):
-    def default(self, obj):
-        if isinstance(obj, np.ndarray):
-            return obj.tolist()
-        return json.JSONEncoder.default(self, obj)
+class FastJSONProvider(DefaultJSONProvider):
+    # Responses are encoded by json_io (orjson with NumPy passthrough when installed)
+    def dumps(self, obj, **kwargs):
+        return json_io.dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return json_io.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(json_io.dumps_bytes(obj), mimetype=self.mimetype)
 
 
 app = Flask(__name__)
-app.json = CustomEncoder(app)
+app.json = FastJSONProvider(app)
 
 cors = CORS(app)
 
 
-model = YOLO("weights/yolov8x-pose.pt")
+MODEL_PATH = "weights/yolov8x-pose.pt"
+WARMUP_IMAGE_SIZE = int(os.environ.get("POSE_WARMUP_IMAGE_SIZE", 640))
+# Torch intra-op threads for this process; 0 keeps the library default
+INTRA_OP_THREADS = int(os.environ.get("POSE_INTRA_OP_THREADS", 0))
 
+MAX_BATCH_SIZE = int(os.environ.get("POSE_MAX_BATCH_SIZE", 8))
+MAX_BATCH_WAIT_MS = float(os.environ.get("POSE_MAX_BATCH_WAIT_MS", 5))
+INFER_TIMEOUT = float(os.environ.get("POSE_INFER_TIMEOUT", 60))  # seconds a request waits for its batch
+FETCH_POOL_SIZE = int(os.environ.get("POSE_FETCH_POOL_SIZE", 32))
+BULK_BATCH_SIZE = int(os.environ.get("POSE_BULK_BATCH_SIZE", 16))
+MAX_BULK_BATCH_SIZE = int(os.environ.get("POSE_MAX_BULK_BATCH_SIZE", 64))
 
-body_connections = np.array(
-    [
-        {"box": [[1, 2], [2, 3], [3, 5], [5, 7]], "class": 0},
-        {"box": [[1, 3]], "class": 0},
-        {"box": [[2, 4], [4, 6]], "class": 0},
-        {"box": [[6, 7], [7, 9]], "class": 1},
-        {"box": [[6, 8], [8, 10]], "class": 1},
-        {"box": [[9, 11]], "class": 1},
-        {"box": [[16, 14], [14, 12]], "class": 2},
-        {"box": [[17, 15], [15, 13]], "class": 2},
-        {"box": [[6, 12], [12, 13]], "class": 3},
-        {"box": [[7, 13]], "class": 3},
-    ]
+# Part of the result cache key, so swapping the weights never serves stale results
+MODEL_VERSION = os.environ.get("POSE_MODEL_VERSION") or (
+    f"{MODEL_PATH}:{os.path.getsize(MODEL_PATH)}:{os.path.getmtime(MODEL_PATH)}"
+    if os.path.exists(MODEL_PATH)
+    else MODEL_PATH
 )
+CACHE_MAX_ENTRIES = int(os.environ.get("POSE_CACHE_MAX_ENTRIES", 1024))
+CACHE_MAX_BYTES = int(os.environ.get("POSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_TTL = float(os.environ.get("POSE_CACHE_TTL", 3600))
+CACHE_DIR = os.environ.get("POSE_CACHE_DIR")  # optional on-disk tier
+CACHE_DISK_MAX_BYTES = int(os.environ.get("POSE_CACHE_DISK_MAX_BYTES", 1024 * 1024 * 1024))
 
 
-def postprocess_pose_keypoints(keypointss):
-    result = []
-    for keypoints in keypointss:
-        for connections in body_connections:
-            boxid = connections["class"]
-            group_line = []
-            for connection in connections["box"]:
-                keypoint_a = keypoints[connection[0] - 1]
-                keypoint_b = keypoints[connection[1] - 1]
-                x_start, y_start, visibility_start = (
-                    keypoint_a[0],
-                    keypoint_a[1],
-                    keypoint_a[2],
-                )
-                x_end, y_end, visibility_end = (
-                    keypoint_b[0],
-                    keypoint_b[1],
-                    keypoint_b[2],
-                )
-                if visibility_start > 0.5 and visibility_end > 0.5:
-                    group_line.append([round(x_start), round(y_start)])
-                    group_line.append([round(x_end), round(y_end)])
-            if len(group_line):
-                result.append(
-                    {
-                        "box": group_line,
-                        "pk": str(uuid.uuid4()),
-                        "class": boxid,
-                        "boxtype": "lines",
-                    }
-                )
-    return result
+def init_image_from_url(_url, coordinates=None):
+    with metrics.time("fetch"):
+        data = image_fetcher.fetch(_url)
+    with metrics.time("decode"):
+        return image_fetcher.decode(data, coordinates)
 
 
-def init_image_from_url(_url, coordinates=None):
-    org_img, _ = download_image_from_url(_url, coordinates)
-    return org_img
+# The model is created on first use instead of at import, so a preforking
+# server loads one instance per worker after the fork
+model = None
+model_ready = threading.Event()
+_model_lock = threading.Lock()
 
 
-class NumpyEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, np.ndarray):
-            return obj.tolist()
-        return json.JSONEncoder.default(self, obj)
+def get_model():
+    global model
+    with _model_lock:
+        if model is None:
+            if INTRA_OP_THREADS > 0:
+                import torch
 
+                torch.set_num_threads(INTRA_OP_THREADS)
+            model = YOLO(MODEL_PATH)
+    return model
+
+
+def warmup():
+    # One dummy inference pays for lazy initialization before traffic arrives
+    dummy = np.zeros((WARMUP_IMAGE_SIZE, WARMUP_IMAGE_SIZE, 3), dtype=np.uint8)
+    get_model()(dummy, verbose=False)
+    model_ready.set()
 
-@app.route("/api3/regions/pose-detection", methods=["GET", "POST"])
-def run_regions_pose():
-    content = request.json
-    image_url = content["image_url"]
 
-    org_img = init_image_from_url(image_url, content.get("coordinates", None))
+def infer_pose_batch(images):
+    # One forward pass for every request the batcher collected
+    with metrics.time("infer"):
+        results = get_model()(images, verbose=False)
+        return [result.keypoints.detach().cpu().numpy() for result in results]
+
+
+metrics = StageMetrics()
+image_fetcher = ImageFetcher(pool_size=FETCH_POOL_SIZE)
+fetch_executor = ThreadPoolExecutor(max_workers=FETCH_POOL_SIZE)
+batcher = MicroBatcher(infer_pose_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_BATCH_WAIT_MS)
+result_cache = ResponseCache(
+    max_entries=CACHE_MAX_ENTRIES,
+    max_bytes=CACHE_MAX_BYTES,
+    ttl=CACHE_TTL,
+    disk_dir=CACHE_DIR,
+    disk_max_bytes=CACHE_DISK_MAX_BYTES,
+)
 
-    results = model(org_img)
-    keypoints = results[0].keypoints
-    keypoints = keypoints.detach().cpu().numpy()
-    result = postprocess_pose_keypoints(keypoints)
 
-    result = {
+def pose_cache_key(org_img, coordinates):
+    # The cache holds raw keypoints, not responses, so every response gets fresh "pk"s
+    return make_key(org_img.tobytes(), coordinates, f"{MODEL_VERSION}:keypoints")
+
+
+def build_pose_result(org_img, keypoints):
+    with metrics.time("postprocess"):
+        result = postprocess_pose_keypoints(keypoints)
+
+    return {
         "bboxes": result,
         "image": {
             "rotation": 0,
@@ -108,4 +130,164 @@ def run_regions_pose():
         },
         "meta": {"rotation": 0, "width": org_img.shape[1], "height": org_img.shape[0]},
     }
-    return jsonify(result)
+
+
+@app.route("/api3/regions/pose-detection", methods=["GET", "POST"])
+def run_regions_pose():
+    content = request.json
+    image_url = content["image_url"]
+
+    coordinates = content.get("coordinates", None)
+    org_img = init_image_from_url(image_url, coordinates)
+
+    # Same pixels, crop and model give the same keypoints, so skip inference on a hit
+    cache_key = pose_cache_key(org_img, coordinates)
+    keypoints = result_cache.get(cache_key)
+    if keypoints is None:
+        # Concurrent requests are gathered into one model call by the batcher
+        future = batcher.submit(org_img)
+        try:
+            keypoints = future.result(timeout=INFER_TIMEOUT)
+        except FutureTimeoutError:
+            # Not inferred at all if the batcher has not picked it up yet
+            future.cancel()
+            return jsonify({"error": f"inference timed out after {INFER_TIMEOUT:g}s"}), 504
+        result_cache.put(cache_key, keypoints)
+    return jsonify(build_pose_result(org_img, keypoints))
+
+
+def load_bulk_item(item):
+    # item is ("url", image_url, coordinates) or ("upload", file_name, data)
+    kind, source, extra = item
+    if kind == "upload":
+        with metrics.time("decode"):
+            return image_fetcher.decode(extra), None
+    return init_image_from_url(source, extra), extra
+
+
+def _try_load_bulk_item(item):
+    try:
+        org_img, coordinates = load_bulk_item(item)
+        return org_img, coordinates, None
+    except Exception as e:
+        return None, None, f"could not load image: {e}"
+
+
+def run_bulk_batch(start, items):
+    """Yield one NDJSON-ready dict per item of this batch, in order.
+
+    Images are loaded concurrently; the ones that loaded and are not
+    cached are submitted to the micro-batcher together, so they share its
+    model calls with the single-image endpoint. Failures are reported on
+    the failing item only.
+    """
+    loaded = list(fetch_executor.map(_try_load_bulk_item, items))
+
+    outputs = [None] * len(items)
+    pending = []
+    for offset, (org_img, coordinates, error) in enumerate(loaded):
+        if error is not None:
+            outputs[offset] = {"error": error}
+            continue
+        cache_key = pose_cache_key(org_img, coordinates)
+        keypoints = result_cache.get(cache_key)
+        if keypoints is None:
+            pending.append((offset, org_img, cache_key))
+            continue
+        try:
+            outputs[offset] = {"result": build_pose_result(org_img, keypoints)}
+        except Exception as e:
+            outputs[offset] = {"error": f"postprocessing failed: {e}"}
+
+    # Through the batcher, so the model only ever runs on its inference thread
+    futures = [(offset, org_img, cache_key, batcher.submit(org_img)) for offset, org_img, cache_key in pending]
+    # One deadline for the whole batch, not INFER_TIMEOUT per image
+    deadline = time.monotonic() + INFER_TIMEOUT
+    for offset, org_img, cache_key, future in futures:
+        try:
+            keypoints = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            future.cancel()
+            outputs[offset] = {"error": f"inference timed out after {INFER_TIMEOUT:g}s"}
+            continue
+        except Exception as e:
+            outputs[offset] = {"error": f"inference failed: {e}"}
+            continue
+        result_cache.put(cache_key, keypoints)
+        try:
+            outputs[offset] = {"result": build_pose_result(org_img, keypoints)}
+        except Exception as e:
+            outputs[offset] = {"error": f"postprocessing failed: {e}"}
+
+    for offset, (item, output) in enumerate(zip(items, outputs)):
+        yield dict({"index": start + offset, "source": item[1]}, **output)
+
+
+@app.route("/api3/regions/pose-detection/batch", methods=["POST"])
+def run_regions_pose_batch():
+    """Pose detection for many images in one call, streamed back as NDJSON.
+
+    Accepts JSON {"images": [{"image_url": ..., "coordinates": ...} or url, ...],
+    "batch_size": n} or a multipart upload with one or more "images" files.
+    One line per image is written as soon as its batch finishes:
+    {"index", "source", "result"} or {"index", "source", "error"}.
+    """
+    if request.files:
+        batch_size = int(request.form.get("batch_size", BULK_BATCH_SIZE))
+        items = [("upload", f.filename, f.read()) for f in request.files.getlist("images")]
+    else:
+        content = request.json
+        batch_size = int(content.get("batch_size", BULK_BATCH_SIZE))
+        items = []
+        for image in content["images"]:
+            if isinstance(image, str):
+                items.append(("url", image, None))
+            else:
+                items.append(("url", image["image_url"], image.get("coordinates", None)))
+    batch_size = max(1, min(batch_size, MAX_BULK_BATCH_SIZE))
+
+    def generate():
+        for start in range(0, len(items), batch_size):
+            for line in run_bulk_batch(start, items[start : start + batch_size]):
+                yield json_io.dumps_bytes(line) + b"\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@app.route("/api3/regions/pose-detection/metrics", methods=["GET"])
+def pose_metrics():
+    batch_sizes = list(batcher.batch_sizes)
+    return jsonify(
+        {
+            "stages": metrics.summary(),
+            "batching": {
+                "max_batch_size": MAX_BATCH_SIZE,
+                "max_wait_ms": MAX_BATCH_WAIT_MS,
+                "batches": len(batch_sizes),
+                "mean_batch_size": sum(batch_sizes) / len(batch_sizes) if batch_sizes else 0,
+            },
+        }
+    )
+
+
+@app.route("/api3/regions/pose-detection/cache-stats", methods=["GET"])
+def pose_cache_stats():
+    return jsonify(result_cache.summary())
+
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    if not model_ready.is_set():
+        return jsonify({"status": "warming up"}), 503
+    return jsonify({"status": "ready", "model_version": MODEL_VERSION})
+
+
+if __name__ == "__main__":
+    # Development server; use gunicorn_conf.py for production serving
+    warmup()
+    app.run(host=os.environ.get("POSE_HOST", "0.0.0.0"), port=int(os.environ.get("POSE_PORT", 5000)), threaded=True)
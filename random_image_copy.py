@@ -1,32 +1,69 @@
 import os
-import shutil
 import random
 import argparse
-from tqdm import tqdm
+import numpy as np
 
-def copy_random_images(input_folder, output_folder, num_images):
+import bulk_copy
+from dataset_manifest import open_manifest
+
+def copy_random_images(input_folder, output_folder, num_images, manifest=None, split=None,
+                       label_folder=None, output_label_folder=None, workers=16, mode='auto', overwrite=False):
+    """Copy num_images randomly chosen images, optionally with their labels.
+
+    With label_folder (or a manifest) and output_label_folder set, only
+    images that have a label file are sampled and <stem>.txt is copied
+    next to each one.
+    """
     # Create the output folder if it doesn't exist
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    # Get a list of all image files in the input folder
-    image_files = [f for f in os.listdir(input_folder) if os.path.isfile(os.path.join(input_folder, f))]
+    paired = output_label_folder is not None
+    if manifest is not None:
+        # Image list straight from the manifest, optionally restricted to one split
+        input_folder = manifest.image_dir
+        label_folder = manifest.label_dir
+        mask = manifest.mask(split, labeled=True if paired else None, has_image=True)
+        image_files = [manifest.image_names[i] for i in np.flatnonzero(mask).tolist()]
+    else:
+        # Get a list of all image files in the input folder
+        image_files = [f for f in os.listdir(input_folder) if os.path.isfile(os.path.join(input_folder, f))]
+        if paired:
+            label_files = set(os.listdir(label_folder))
+            image_files = [f for f in image_files if os.path.splitext(f)[0] + '.txt' in label_files]
 
     # Randomly select 'num_images' from the list of image files
     selected_files = random.sample(image_files, num_images)
 
-    # Copy the selected files to the output folder
-    for file_name in tqdm(selected_files, desc='Copying images', unit='image'):
-        src_path = os.path.join(input_folder, file_name)
-        dst_path = os.path.join(output_folder, file_name)
-        shutil.copy(src_path, dst_path)
+    # Copy the selected files (and their labels) to the output folders in parallel
+    pairs = [(os.path.join(input_folder, file_name), os.path.join(output_folder, file_name)) for file_name in selected_files]
+    if paired:
+        for file_name in selected_files:
+            label_name = os.path.splitext(file_name)[0] + '.txt'
+            pairs.append((os.path.join(label_folder, label_name), os.path.join(output_label_folder, label_name)))
+    return bulk_copy.copy_files(pairs, workers=workers, mode=mode, overwrite=overwrite, desc='Copying images')
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Randomly copy a specified number of images from an input folder to an output folder.')
     parser.add_argument('--input_folder', type=str, help='Path to the input folder containing images')
     parser.add_argument('--output_folder', type=str, help='Path to the output folder for copied images')
     parser.add_argument('--num_images', type=int, help='Number of images to randomly select and copy')
+    parser.add_argument('--manifest', type=str, help='Dataset manifest directory (see dataset_manifest.py); replaces --input_folder')
+    parser.add_argument('--split', type=str, help='With --manifest, only sample images of this split (e.g. train, val)')
+    parser.add_argument('--label_folder', type=str, help='Folder with the YOLO label txt files (paired mode)')
+    parser.add_argument('--output_label_folder', type=str, help='Copy the label of every selected image here; only labeled images are sampled')
+    parser.add_argument('--workers', type=int, default=16, help='Number of copy threads')
+    parser.add_argument('--mode', choices=bulk_copy.MODES, default='auto',
+                        help='auto: reflink if possible, else in-kernel copy; hardlink: link when on the same file system')
+    parser.add_argument('--overwrite', action='store_true', help='Copy even if the destination has the same size and mtime')
 
     args = parser.parse_args()
 
-    copy_random_images(args.input_folder, args.output_folder, args.num_images)
+    if args.output_label_folder and not (args.label_folder or args.manifest):
+        parser.error('--output_label_folder needs --label_folder or --manifest')
+
+    manifest = open_manifest(args.manifest) if args.manifest else None
+    stats = copy_random_images(args.input_folder, args.output_folder, args.num_images, manifest=manifest, split=args.split,
+                               label_folder=args.label_folder, output_label_folder=args.output_label_folder,
+                               workers=args.workers, mode=args.mode, overwrite=args.overwrite)
+    bulk_copy.print_throughput(stats)
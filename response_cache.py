@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import json_io
+
+
+def make_key(image_bytes, coordinates=None, model_version=''):
+    # Content key: the decoded pixels, the requested crop and the model that produced the answer
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(image_bytes)
+    digest.update(json.dumps(coordinates, sort_keys=True).encode('utf-8'))
+    digest.update(str(model_version).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResponseCache():
+    """Bounded LRU cache of JSON-serializable responses with an optional disk tier.
+
+    Entries expire after ttl seconds. The memory tier holds at most
+    max_entries entries and max_bytes of serialized JSON, evicting the
+    least recently used first. With disk_dir set, entries are also
+    written there as <key>.json, survive restarts and are promoted back
+    into memory on a hit. The disk tier is kept under disk_max_bytes by a
+    sweep that drops expired files, then the least recently used ones;
+    unreadable files count as misses.
+    """
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=3600, disk_dir=None,
+                 disk_max_bytes=1024 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+
+        self._entries = OrderedDict()  # key -> (created, size, value)
+        self._bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0, 'disk_evictions': 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self.sweep_disk()
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + '.json')
+
+    def _store(self, key, created, size, value):
+        # Caller holds the lock
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (created, size, value)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.stats['evictions'] += 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return entry[2]
+                self._bytes -= self._entries.pop(key)[1]
+                self.stats['expired'] += 1
+
+        value = self._get_from_disk(key)
+        with self._lock:
+            if value is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+            return value
+
+    def _get_from_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Touched on read, so the sweep drops the least recently used files
+            os.utime(path)
+        except OSError:
+            return None
+        try:
+            entry = json_io.loads(data)
+            created, value = entry['created'], entry['value']
+        except (ValueError, KeyError, TypeError):
+            # Partial or corrupt file: drop it and recompute
+            self._unlink(path)
+            return None
+        if self._expired(created):
+            self._unlink(path)
+            return None
+        with self._lock:
+            self._store(key, created, len(data), value)
+        return value
+
+    def put(self, key, value):
+        created = time.time()
+        data = json_io.dumps_bytes({'created': created, 'value': value})
+        with self._lock:
+            self._store(key, created, len(data), value)
+        if self.disk_dir:
+            # Write then rename, so readers never see a partial file
+            tmp_path = self._disk_path(key) + f'.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._disk_path(key))
+            with self._lock:
+                self._disk_bytes += len(data)
+                over_budget = self._disk_bytes > self.disk_max_bytes
+            if over_budget:
+                self.sweep_disk()
+
+    def sweep_disk(self):
+        """Delete expired disk entries and stale temporary files, then the least
+        recently used entries until the disk tier is under 90% of disk_max_bytes."""
+        now = time.time()
+        files = []
+        with os.scandir(self.disk_dir) as entries:
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if entry.name.endswith('.tmp'):
+                    # Left behind by a killed writer; live ones are only seconds old
+                    if now - stat.st_mtime > 3600:
+                        self._unlink(entry.path)
+                elif entry.name.endswith('.json'):
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        target = self.disk_max_bytes * 0.9 if total > self.disk_max_bytes else None
+        removed = 0
+        # Reads only move a file's mtime forward, so an mtime older than ttl means it expired
+        for mtime, size, path in sorted(files):
+            expired = self.ttl is not None and now - mtime > self.ttl
+            if (expired or (target is not None and total > target)) and self._unlink(path):
+                total -= size
+                removed += 1
+        with self._lock:
+            self._disk_bytes = total
+            self.stats['disk_evictions'] += removed
+
+    @staticmethod
+    def _unlink(path):
+        # Another process may have removed it first
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def summary(self):
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['disk_hits'] + self.stats['misses']
+            return dict(self.stats,
+                        entries=len(self._entries),
+                        bytes=self._bytes,
+                        max_entries=self.max_entries,
+                        max_bytes=self.max_bytes,
+                        disk_bytes=self._disk_bytes,
+                        hit_rate=(self.stats['hits'] + self.stats['disk_hits']) / lookups if lookups else 0.0)
@@ -0,0 +1,69 @@
+import numpy as np
+
+# iMaterialist EncodedPixels: "start length start length ..." with 1-based
+# starts over pixels numbered top to bottom, then left to right
+# (column-major), the same pixel order COCO RLE uses.
+
+
+def parse_encoded_pixels(encoded_pixels):
+    # Returns 0-based run starts and run lengths
+    values = np.array(encoded_pixels.split(), dtype=np.int64)
+    return values[0::2] - 1, values[1::2]
+
+
+def rle_area(lengths):
+    return int(lengths.sum())
+
+
+def rle_bbox(starts, lengths, height):
+    """Bounding box [x, y, x_max - x_min, y_max - y_min] straight from the runs.
+
+    Same convention as utils.get_bbox on the decoded mask, without
+    building the mask. A run that wraps into the next column covers whole
+    columns in between, so it reaches the top and bottom rows.
+    """
+    if not len(starts):
+        return [0, 0, 0, 0]
+    ends = starts + lengths - 1
+    start_cols, start_rows = np.divmod(starts, height)
+    end_cols, end_rows = np.divmod(ends, height)
+    wraps = end_cols > start_cols
+
+    x_min = int(start_cols.min())
+    x_max = int(end_cols.max())
+    y_min = 0 if wraps.any() else int(start_rows.min())
+    y_max = height - 1 if wraps.any() else int(end_rows.max())
+    return [x_min, y_min, x_max - x_min, y_max - y_min]
+
+
+def to_coco_rle(starts, lengths, height, width):
+    # Uncompressed COCO RLE: alternating background/foreground run lengths, starting with background
+    counts = np.empty(len(starts) * 2 + 1, dtype=np.int64)
+    ends = starts + lengths
+    counts[0:-1:2] = starts - np.concatenate(([0], ends[:-1]))
+    counts[1::2] = lengths
+    counts[-1] = height * width - (ends[-1] if len(ends) else 0)
+    if counts[-1] == 0:
+        counts = counts[:-1]
+    return {'counts': counts.tolist(), 'size': [int(height), int(width)]}
+
+
+def decode_to_mask(starts, lengths, height, width):
+    # Mark run starts with +1 and run ends with -1, then a cumulative sum fills the runs
+    # (runs never overlap, so each index appears once per assignment)
+    delta = np.zeros(height * width + 1, dtype=np.int8)
+    delta[starts] += 1
+    delta[starts + lengths] -= 1
+    flat = np.cumsum(delta[:-1], dtype=np.int8).astype(np.uint8)
+    return np.ascontiguousarray(flat.reshape(width, height).T)
+
+
+def binary_mask_to_rle(mask):
+    # Uncompressed COCO RLE of a binary (height, width) mask
+    flat = np.asarray(mask, dtype=bool).ravel(order='F')
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    boundaries = np.concatenate(([0], changes, [flat.size]))
+    counts = np.diff(boundaries)
+    if flat.size and flat[0]:
+        counts = np.concatenate(([0], counts))
+    return {'counts': counts.tolist(), 'size': list(mask.shape)}
@@ -0,0 +1,62 @@
+import json
+
+import coco_stream
+from coco_cache import CocoCache, compile_cache
+
+
+def _write_coco(path):
+    coco = {
+        'info': {'description': 'test'},
+        'licenses': [{'id': 1, 'name': 'cc'}],
+        'images': [
+            {'id': 2, 'file_name': 'b.jpg', 'width': 40, 'height': 30, 'license': 1},
+            {'id': 1, 'file_name': 'a.jpg', 'width': 20, 'height': 10},
+        ],
+        'annotations': [
+            {'id': 10, 'image_id': 2, 'category_id': 1, 'segmentation': [[1, 2, 10, 2, 10, 12]],
+             'area': 45, 'bbox': [1, 2, 9, 10], 'iscrowd': 0,
+             'keypoints': [12, 30, 2, 0, 0, 0], 'num_keypoints': 1},
+            {'id': 11, 'image_id': 1, 'category_id': 1, 'segmentation': [[1.5, 2.25, 8.0, 2.0, 8.0, 9.5]],
+             'area': 20.5, 'bbox': [1.5, 2.0, 6.5, 7.5], 'iscrowd': 0,
+             'keypoints': [3.5, 4.25, 2.0], 'num_keypoints': 1, 'attribute_ids': [4, 7]},
+            {'id': 12, 'image_id': 2, 'category_id': 2, 'segmentation': {'size': [30, 40], 'counts': [5, 10, 1185]},
+             'area': 10, 'bbox': [0, 5, 1, 10], 'iscrowd': 1},
+        ],
+        'categories': [{'id': 1, 'name': 'person'}, {'id': 2, 'name': 'crowd'}],
+    }
+    with open(path, 'w') as f:
+        json.dump(coco, f)
+    return coco
+
+
+def test_round_trip_matches_json(tmp_path):
+    json_path = str(tmp_path / 'coco.json')
+    coco = _write_coco(json_path)
+    cache_dir = compile_cache(json_path)
+    cache = CocoCache(cache_dir)
+
+    annotations = {annotation['id']: annotation for annotation in coco['annotations']}
+    for row in range(len(annotations)):
+        annotation = cache.annotation(row)
+        assert annotation == annotations[annotation['id']]
+        # Types too: ints stay ints and floats stay floats
+        assert json.dumps(annotation, sort_keys=True) == json.dumps(annotations[annotation['id']], sort_keys=True)
+
+    images = {image['id']: image for image in coco['images']}
+    for row in range(len(images)):
+        image = cache.image_info(row)
+        assert image == images[image['id']]
+
+
+def test_integer_keypoints_stay_integers(tmp_path):
+    json_path = str(tmp_path / 'coco.json')
+    _write_coco(json_path)
+    cache = CocoCache(compile_cache(json_path))
+
+    streamed = {annotation['id']: annotation for annotation in coco_stream.iter_annotations(json_path)}
+    for row in range(3):
+        annotation = cache.annotation(row)
+        if 'keypoints' in annotation:
+            expected = streamed[annotation['id']]['keypoints']
+            assert [type(value) for value in annotation['keypoints']] == [type(value) for value in expected]
+            assert annotation['keypoints'] == expected
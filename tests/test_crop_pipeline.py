@@ -0,0 +1,73 @@
+import argparse
+import json
+
+import pytest
+
+import recalculateBBOXandSegPointsNew
+from crop_pipeline import crop_dataset, reproject_annotations
+
+
+def test_polygon_bbox_is_recomputed_inside_crop():
+    annotations = [{'bbox': [10, 10, 20, 20], 'area': 400, 'segmentation': [[10, 10, 30, 10, 30, 30, 10, 30]]}]
+    reproject_annotations(annotations, (5, 5, 50, 50), 100, 100)
+    assert annotations[0]['bbox'] == [5.0, 5.0, 20.0, 20.0]
+    assert annotations[0]['area'] == pytest.approx(400.0)
+
+
+def test_annotation_without_points_keeps_moved_bbox():
+    annotations = [{'bbox': [10, 10, 20, 20], 'area': 400, 'segmentation': []}]
+    reproject_annotations(annotations, (5, 5, 50, 50), 100, 100)
+    assert annotations[0]['bbox'] == [5.0, 5.0, 20.0, 20.0]
+    assert annotations[0]['area'] == pytest.approx(400.0)
+
+
+def test_annotation_without_points_is_clamped_and_scaled():
+    annotations = [
+        {'bbox': [0, 0, 10, 10], 'area': 100, 'segmentation': [[0, 0, 10, 0, 10, 10, 0, 10]]},
+        {'bbox': [40, 40, 20, 20], 'area': 400, 'segmentation': []},
+    ]
+    reproject_annotations(annotations, (0, 0, 50, 50), 100, 100, scale=0.5)
+    assert annotations[0]['bbox'] == [0.0, 0.0, 5.0, 5.0]
+    # Clamped to the 50x50 crop, then halved
+    assert annotations[1]['bbox'] == [20.0, 20.0, 5.0, 5.0]
+    assert annotations[1]['area'] == pytest.approx(25.0)
+
+
+def _write_coco(path):
+    coco = {
+        'info': {'description': 'test', 'year': 2024},
+        'licenses': [{'id': 1, 'name': 'cc-by'}],
+        'images': [{'id': 1, 'file_name': 'a.jpg', 'width': 100, 'height': 100}],
+        'annotations': [{'id': 1, 'image_id': 1, 'category_id': 1, 'bbox': [10, 10, 20, 20], 'area': 400,
+                         'iscrowd': 0, 'segmentation': [[10, 10, 30, 10, 30, 30, 10, 30]]}],
+        'categories': [{'id': 1, 'name': 'person'}],
+        'custom': {'kept': True},
+    }
+    with open(path, 'w') as f:
+        json.dump(coco, f)
+    return coco
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_recalculate_keeps_top_level_keys(tmp_path, stream):
+    input_json = str(tmp_path / 'in.json')
+    output_json = str(tmp_path / 'out.json')
+    coco = _write_coco(input_json)
+    args = argparse.Namespace(input_json=input_json, output_json=output_json, stream=stream, no_images=True,
+                              image_dir=None, output_image_dir=None, scale=None, quality=95, image_workers=None,
+                              overwrite=False, pretty=False)
+    recalculateBBOXandSegPointsNew.main(args)
+
+    with open(output_json) as f:
+        output = json.load(f)
+    for key in ('info', 'licenses', 'categories', 'custom'):
+        assert output[key] == coco[key]
+    assert len(output['images']) == 1 and len(output['annotations']) == 1
+
+
+def test_crop_dataset_keeps_top_level_keys(tmp_path):
+    coco = _write_coco(str(tmp_path / 'in.json'))
+    output = crop_dataset(coco)
+    assert output['info'] == coco['info']
+    assert output['licenses'] == coco['licenses']
+    assert output['custom'] == coco['custom']
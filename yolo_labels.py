@@ -0,0 +1,202 @@
+import os
+import argparse
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from tqdm import tqdm
+
+import json_io
+
+
+def parse_yolo_text(text, dtype=np.float32):
+    """Parse the contents of one YOLO label file into packed arrays.
+
+    Each line is "class x1 y1 x2 y2 ..." with normalized coordinates (a box
+    has 2 points, a polygon more). Returns (class_ids, points, offsets,
+    malformed): instance i has class class_ids[i] and the (n, 2) points
+    points[offsets[i]:offsets[i + 1]]. All numbers are converted in one
+    NumPy call; malformed lines are skipped and listed as
+    (line_no, text, reason).
+    """
+    lines = text.splitlines()
+    rows = [line.split() for line in lines]
+    counts = np.fromiter(map(len, rows), dtype=np.int64, count=len(rows))
+    malformed = []
+
+    try:
+        values = np.array(list(chain.from_iterable(rows)), dtype=np.float64)
+    except ValueError:
+        # Some token is not a number; find those lines, drop them and convert the rest
+        for row_index, row in enumerate(rows):
+            for position, value in enumerate(row):
+                try:
+                    float(value)
+                except ValueError:
+                    reason = 'class is not an integer' if position == 0 else 'coordinate is not a number'
+                    malformed.append((row_index + 1, lines[row_index], reason))
+                    counts[row_index] = 0
+                    rows[row_index] = []
+                    break
+        values = np.array(list(chain.from_iterable(rows)), dtype=np.float64)
+
+    starts = np.zeros(len(rows), dtype=np.int64)
+    if len(rows):
+        np.cumsum(counts[:-1], out=starts[1:])
+    present = counts > 0
+    class_values = np.zeros(len(rows))
+    class_values[present] = values[starts[present]]
+    num_coordinates = counts - 1
+
+    bad_class = present & (class_values != np.floor(class_values))
+    bad_count = present & ~bad_class & ((num_coordinates < 4) | (num_coordinates % 2 == 1))
+    for row_index in np.flatnonzero(bad_class).tolist():
+        malformed.append((row_index + 1, lines[row_index], 'class is not an integer'))
+    for row_index in np.flatnonzero(bad_count).tolist():
+        malformed.append((row_index + 1, lines[row_index], f'{num_coordinates[row_index]} coordinates'))
+    malformed.sort()
+
+    good = present & ~bad_class & ~bad_count
+    token_rows = np.repeat(np.arange(len(rows)), counts)
+    is_class = np.zeros(len(values), dtype=bool)
+    is_class[starts[present]] = True
+
+    class_ids = class_values[good].astype(np.int32)
+    points = values[good[token_rows] & ~is_class].astype(dtype).reshape(-1, 2)
+    offsets = np.zeros(len(class_ids) + 1, dtype=np.int64)
+    np.cumsum(num_coordinates[good] // 2, out=offsets[1:])
+    return class_ids, points, offsets, malformed
+
+
+def read_label_file(path, dtype=np.float32):
+    # One bulk read per file
+    with open(path, 'rb') as f:
+        text = f.read().decode('utf-8', errors='replace')
+    return parse_yolo_text(text, dtype=dtype)
+
+
+class YoloLabelSet():
+    """The labels of many files in flat arrays.
+
+    File f owns instances file_offsets[f]:file_offsets[f + 1]; instance i
+    has class class_ids[i] and points points[point_offsets[i]:point_offsets[i + 1]]
+    (normalized x, y). Lookups by index or file name are O(1) slices.
+    """
+    def __init__(self, names, class_ids, points, point_offsets, file_offsets):
+        self.names = list(names)
+        self.class_ids = class_ids
+        self.points = points
+        self.point_offsets = point_offsets
+        self.file_offsets = file_offsets
+        self.index = {name: f for f, name in enumerate(self.names)}
+        self._bboxes = None
+
+    @classmethod
+    def from_files(cls, paths, names=None, workers=32, dtype=np.float32):
+        # Files are read in a thread pool; names default to the file names
+        paths = list(paths)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            parsed = list(tqdm(executor.map(lambda path: read_label_file(path, dtype), paths),
+                               total=len(paths), desc='Reading labels'))
+
+        instance_counts = [len(class_ids) for class_ids, _, _, _ in parsed]
+        point_counts = [len(points) for _, points, _, _ in parsed]
+        file_offsets = np.zeros(len(parsed) + 1, dtype=np.int64)
+        np.cumsum(instance_counts, out=file_offsets[1:])
+
+        point_offsets = np.zeros(file_offsets[-1] + 1, dtype=np.int64)
+        point_base = 0
+        for f, (_, _, offsets, _) in enumerate(parsed):
+            point_offsets[file_offsets[f] + 1:file_offsets[f + 1] + 1] = offsets[1:] + point_base
+            point_base += point_counts[f]
+
+        class_ids = np.concatenate([p[0] for p in parsed]) if parsed else np.zeros(0, dtype=np.int32)
+        points = np.concatenate([p[1] for p in parsed]) if parsed else np.zeros((0, 2), dtype=dtype)
+        if names is None:
+            names = [os.path.basename(path) for path in paths]
+        return cls(names, class_ids, points, point_offsets, file_offsets)
+
+    def __len__(self):
+        return len(self.names)
+
+    def file_index(self, name_or_index):
+        if isinstance(name_or_index, str):
+            return self.index[name_or_index]
+        return name_or_index
+
+    def instances(self, name_or_index):
+        f = self.file_index(name_or_index)
+        return range(self.file_offsets[f], self.file_offsets[f + 1])
+
+    def classes(self, name_or_index):
+        f = self.file_index(name_or_index)
+        return self.class_ids[self.file_offsets[f]:self.file_offsets[f + 1]]
+
+    def polygons(self, name_or_index, width=1, height=1):
+        # (n, 2) point arrays of one file, scaled to pixels when width/height are given
+        f = self.file_index(name_or_index)
+        first, last = self.file_offsets[f], self.file_offsets[f + 1]
+        points = self.points[self.point_offsets[first]:self.point_offsets[last]]
+        if width != 1 or height != 1:
+            points = points * (width, height)
+        bounds = self.point_offsets[first:last + 1] - self.point_offsets[first]
+        return [points[start:end] for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist())]
+
+    @property
+    def bboxes_normalized(self):
+        # x_min, y_min, x_max, y_max of every instance, computed once for the whole set
+        if self._bboxes is None:
+            bboxes = np.zeros((len(self.class_ids), 4), dtype=self.points.dtype)
+            if len(self.class_ids):
+                starts = self.point_offsets[:-1]
+                bboxes[:, :2] = np.minimum.reduceat(self.points, starts, axis=0)
+                bboxes[:, 2:] = np.maximum.reduceat(self.points, starts, axis=0)
+            self._bboxes = bboxes
+        return self._bboxes
+
+    def bboxes(self, name_or_index, width=1, height=1):
+        f = self.file_index(name_or_index)
+        bboxes = self.bboxes_normalized[self.file_offsets[f]:self.file_offsets[f + 1]]
+        if width != 1 or height != 1:
+            bboxes = bboxes * (width, height, width, height)
+        return bboxes
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in ('class_ids', 'points', 'point_offsets', 'file_offsets'):
+            np.save(os.path.join(directory, name + '.npy'), getattr(self, name))
+        # names.json is written last, so a pack without it is incomplete
+        json_io.dump(self.names, os.path.join(directory, 'names.json'))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        # The arrays are memory-mapped, so opening a whole split is instant
+        mmap_mode = 'r' if mmap else None
+        arrays = [np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode)
+                  for name in ('class_ids', 'points', 'point_offsets', 'file_offsets')]
+        return cls(json_io.load(os.path.join(directory, 'names.json')), *arrays)
+
+
+def read_split_list(list_path):
+    # train.txt / val.txt: one label file name per line
+    with open(list_path, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def load_split(list_path, label_dir, workers=32, dtype=np.float32):
+    names = read_split_list(list_path)
+    return YoloLabelSet.from_files([os.path.join(label_dir, name) for name in names], names=names,
+                                   workers=workers, dtype=dtype)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pack the YOLO labels of a split into memory-mappable arrays')
+    parser.add_argument('--list', required=True, help='Split list with one label file name per line (train.txt, val.txt)')
+    parser.add_argument('--label_dir', required=True, help='Directory with the label txt files')
+    parser.add_argument('--output', required=True, help='Output directory for the packed arrays')
+    parser.add_argument('--workers', type=int, default=32, help='Threads reading label files')
+    args = parser.parse_args()
+
+    labels = load_split(args.list, args.label_dir, workers=args.workers)
+    labels.save(args.output)
+    print(f'Packed {len(labels)} files, {len(labels.class_ids)} instances, {len(labels.points)} points to {args.output}')